@@ -1,28 +1,33 @@
 import numpy as np
 import matplotlib.pyplot as plt
 from scipy.optimize import minimize
+from concurrent.futures import ProcessPoolExecutor
 from scipy.special import zeta #https://docs.scipy.org/doc/scipy-0.14.0/reference/generated/scipy.special.zeta.html
 '''
 If you need theoretical explaination, please look Fitting_MLE.ipynb
 '''
 
 def incomplete_harmonic(x):
-    x_min = x[0]
-    x_max = x[1]
-    b = x[2]
-    P = 0
-    for k in range(int(x_min) , int(x_max) + 1):
-        P = P + 1 / k ** b
-    return P
+    #sum_{k = x_min}^{x_max} 1/k^b, where x = (x_min, x_max, b)
+    return incomplete_shifted_harmonic(x, 0)
 
 def incomplete_shifted_harmonic(x, c):
-    x_min = x[0]
-    x_max = x[1]
-    b = x[2]
-    P = 0
-    for k in range(int(x_min) , int(x_max) + 1):
-        P = P + 1 / (k + c) ** b
-    return P
+    #sum_{k = x_min}^{x_max} 1/(k + c)^b, where x = (x_min, x_max, b)
+    #O(1) by Hurwitz zeta: zeta(b, x_min + c) - zeta(b, x_max + 1 + c)
+    #the zeta difference is invalid for b <= 1 or x_min + c <= 0, and loses precision if the tail is almost as large as the head,
+    #in these cases use a vectorized sum instead
+    x_min = int(x[0])
+    x_max = int(x[1])
+    b = np.asarray(x[2], dtype = float)
+    if x_min + c > 0 and np.all(b > 1):
+        head = zeta(b, x_min + c)
+        P = head - zeta(b, x_max + 1 + c)
+        if np.all(np.isfinite(P)) and np.all(P > 1e-6 * head):
+            return P
+    k = np.arange(x_min, x_max + 1) + c
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        P = np.sum(k[None, :] ** -np.atleast_1d(b)[:, None], axis = 1)
+    return P.reshape(b.shape)[()]
 
 def Zipf_law(x, a, b):
     return a * x ** (-b)
@@ -30,6 +35,12 @@ def Zipf_law(x, a, b):
 def Zipf_Mandelbrot(x, a, b, c):
     return a * (x + c) ** (-b)
 
+def log_grid(x_min, x_max, num = 500):
+    '''x of a fitted curve on log-log axes: num log-spaced points in [x_min, x_max]
+    The number of points does not grow with x_max, a straight linspace of (x_max - x_min)*10 points is 10^7 points for 10^6 ranks.
+    '''
+    return np.geomspace(x_min, x_max, num = num)
+
 def Two_to_One(y):
     #y = ([rank], [frequency of the rank])
     Y = []
@@ -83,6 +94,106 @@ def L_Zipf_zeta(b, Y):
     N = sum(y[1])
     return b * ln + N * np.log(zeta(b, int(min(y[0]))))
 
+class ZipfFitter:
+    '''
+    MLE fitter of Zipf and Zipf-Mandelbrot for one FRD, y = ([rank], [frequency of the rank]).
+    
+    The sufficient statistics of Zipf (N = sum f, sum f*ln r, rank bounds) are computed once here,
+    instead of unpacking Y by One_to_Two() in every call of L_Zipf() / L_Zipf_Mandelbrot().
+    Both negative log likelihoods return their exact gradient, so minimize() needs no finite differences.
+    fit_Zipf() and fit_Zipf_Mandelbrot() return the OptimizeResult of minimize() (x, fun, jac, ...) as before.
+    '''
+    def __init__(self, rank, freq):
+        self.rank = np.asarray(rank, dtype = float)
+        self.freq = np.asarray(freq, dtype = float)
+        self.N = self.freq.sum()
+        self.S_ln = np.sum(self.freq * np.log(self.rank)) #sum f*ln r
+        self.x_min = int(self.rank.min())
+        self.x_max = int(self.rank.max())
+        self.k = np.arange(self.x_min, self.x_max + 1, dtype = float) #support of the normalization
+        self.ln_k = np.log(self.k)
+    
+    @classmethod
+    def from_Y(cls, Y):
+        #Y = Two_to_One(y)
+        Y = np.asarray(Y, dtype = float)
+        return cls(Y[:len(Y)//2], Y[len(Y)//2:])
+    
+    def b_0(self):
+        #Estimate exponent. This action can make reduce the error of initial value guess.
+        f = self.freq[self.freq > 0] #ranks without data (e.g. synthetic FRD) are skipped
+        freq_M, freq_m = f.max(), f.min()
+        if freq_M == freq_m or self.x_max == self.x_min:
+            return 1.0
+        return np.log(freq_M / freq_m) / np.log(self.x_max / self.x_min)
+    
+    def L_Zipf(self, b):
+        #negative log likelihood of Zipf and its gradient
+        #L = b*sum(f ln r) + N ln H(b), dL/db = sum(f ln r) - N * sum(ln k / k^b) / H(b)
+        b = float(np.ravel(b)[0])
+        H = incomplete_harmonic((self.x_min, self.x_max, b))
+        dH = -np.sum(self.ln_k * self.k ** -b)
+        return b * self.S_ln + self.N * np.log(H), np.array([self.S_ln + self.N * dH / H])
+    
+    def L_Zipf_Mandelbrot(self, bc):
+        #"negative" log likelihood of Zipf_Mandelbrot and its gradient
+        #L = b*sum(f ln(r + c)) + N ln H(b, c)
+        #dL/db = sum(f ln(r + c)) - N * sum(ln(k + c) / (k + c)^b) / H
+        #dL/dc = b*sum(f / (r + c)) - N * b * sum(1 / (k + c)^(b + 1)) / H
+        b, c = float(bc[0]), float(bc[1])
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            kc = self.k + c
+            p = kc ** -b
+            H = np.sum(p)
+            ln_kc = np.log(kc)
+            S_ln = np.sum(self.freq * np.log(self.rank + c))
+            L = b * S_ln + self.N * np.log(H)
+            dLdb = S_ln - self.N * np.sum(ln_kc * p) / H
+            dLdc = b * np.sum(self.freq / (self.rank + c)) - self.N * b * np.sum(p / kc) / H
+        return L, np.array([dLdb, dLdc])
+    
+    def fit_Zipf(self, b_0 = None):
+        #fit Zipf: P(x, b)=a_Z/x^b_Z, a_Z = a_Zipf(res['x'])
+        if b_0 is None:
+            b_0 = self.b_0()
+        return minimize(self.L_Zipf, b_0, jac = True)
+    
+    def fit_Zipf_Mandelbrot(self, bc_0 = None, bounds = None):
+        #fit Zipf-Mandelbrot: P(x, b, c)=a_ZM/(x+c_ZM)^b_ZM, a_ZM = a_Zipf_Mandelbrot(res['x'])
+        #bounds: EX: bounds_Zipf_Mandelbrot(x_min, x_max) keeps c_ZM > -x_min (L-BFGS-B), None is unbounded as before
+        if bc_0 is None:
+            bc_0 = (self.b_0(), 0)
+        return minimize(self.L_Zipf_Mandelbrot, bc_0, jac = True, bounds = bounds)
+    
+    def a_Zipf(self, b):
+        return 1 / incomplete_harmonic((self.x_min, self.x_max, b))
+    
+    def a_Zipf_Mandelbrot(self, bc):
+        return 1 / incomplete_shifted_harmonic((self.x_min, self.x_max, float(bc[0])), float(bc[1]))
+
+def fit_Zipf_row(y):
+    #fit Zipf for one y = ([rank], [frequency of the rank]), return (a_Z, b_Z, neg_L, jac)
+    fitter = ZipfFitter(y[0], y[1])
+    res = fitter.fit_Zipf()
+    b_Z = float(res['x'][0])
+    return (float(fitter.a_Zipf(b_Z)), b_Z, float(res['fun']), float(res['jac'][0]))
+
+def Zipf_batch(tables, n_jobs = 1, chunksize = 4):
+    '''fit the Zipf exponents of many FRDs, one row per FRD
+    
+    tables: list of y = ([rank], [frequency of the rank])
+    n_jobs: number of worker processes, n_jobs = 1 fits them one by one
+    chunksize: number of FRDs sent to a worker at once
+    
+    return rows: np.array, shape = (len(tables), 4), rows[i] = (a_Z, b_Z, neg_L, jac) of tables[i]
+    '''
+    if n_jobs > 1:
+        with ProcessPoolExecutor(n_jobs) as executor:
+            rows = list(executor.map(fit_Zipf_row, tables, chunksize = chunksize))
+    else:
+        rows = [fit_Zipf_row(y) for y in tables]
+    return np.array(rows, dtype = float).reshape(-1, 4)
+
 def AICc_choose(L, k, N):
     '''choose the best model by comparing their AICc
     
@@ -115,34 +226,423 @@ def Z_ZM_choose(Y):
     '''
     choose Zipf or Zipf-Mandelbrot to be the dest fits depend on aicc
     '''
-    y = One_to_Two(Y)
-    #Estimate exponent. This action can make reduce the error of initial value guess.
-    freq_M, freq_m = max(y[1]), min(y[1])
-    rank_M, rank_m = max(y[0]), min(y[0])
-    b_0 = np.log(freq_M / freq_m) / np.log(rank_M / rank_m)
+    fitter = ZipfFitter.from_Y(Y)
     
     #fit Zipf: P(x, b)=a_Z/x^b_Z
-    res_Z = minimize(L_Zipf, b_0, Y)
+    res_Z = fitter.fit_Zipf()
     b_Z = res_Z['x']
-    t_Z = (int(min(y[0])), int(max(y[0])), b_Z)
-    a_Z = 1 / incomplete_harmonic(t_Z)
+    a_Z = fitter.a_Zipf(b_Z)
     Z_para = (a_Z, b_Z)
     
     #fit Zipf-Mandelbrot: P(x, b, c)=a_ZM/(x+c_ZM)^b_ZM
-    res_ZM = minimize(L_Zipf_Mandelbrot, (b_0, 0), Y)
+    res_ZM = fitter.fit_Zipf_Mandelbrot()
     b_ZM = res_ZM['x'][0]
     c_ZM = res_ZM['x'][1]
-    t_ZM = [int(min(y[0])), int(max(y[0])), b_ZM]
-    a_ZM = 1 / incomplete_shifted_harmonic(t_ZM, c_ZM)
+    a_ZM = fitter.a_Zipf_Mandelbrot((b_ZM, c_ZM))
     ZM_para = (a_ZM, b_ZM, c_ZM)
     
     #comparing their aicc
     L = [res_Z.fun, res_ZM.fun]
     k = [1,2]
-    N = sum(y[1])
+    N = fitter.N
     aicc_index, aicc = AICc_choose(L, k, N)
     
     model_list = ['Zipf', 'Zipf-Mandelbrot']    
     print('the best fits is model %s' % model_list[aicc_index])
     
-    return aicc_index, aicc, Z_para, ZM_para
\ No newline at end of file
+    return aicc_index, aicc, Z_para, ZM_para
+
+def Z_ZM_replicate(freq, seed):
+    #one bootstrap replicate of Z_ZM_bootstrap(): multinomial resample of freq -> FRD -> fit Zipf and Zipf-Mandelbrot
+    #return (b_Z, b_ZM, c_ZM, aicc_index), b_ZM, c_ZM and aicc_index are nan if the Zipf-Mandelbrot fit fails
+    rng = np.random.default_rng(seed)
+    N = int(np.sum(freq))
+    f = rng.multinomial(N, freq / np.sum(freq))
+    f = np.sort(f[f > 0])[::-1]
+    fitter = ZipfFitter(np.arange(1, len(f) + 1), f)
+    res_Z = fitter.fit_Zipf()
+    #unbounded, the fit runs away on Zipf-like data (b_ZM, c_ZM -> -inf), so c_ZM is bounded as in model_registry
+    res_ZM = fitter.fit_Zipf_Mandelbrot(bounds = bounds_Zipf_Mandelbrot(fitter.x_min, fitter.x_max))
+    if not (res_ZM.success and np.isfinite(res_ZM.fun) and np.isfinite(fitter.a_Zipf_Mandelbrot(res_ZM['x']))):
+        return (float(res_Z['x'][0]), np.nan, np.nan, np.nan)
+    aicc_index, aicc = AICc_choose([res_Z.fun, res_ZM.fun], [1, 2], N)
+    return (float(res_Z['x'][0]), float(res_ZM['x'][0]), float(res_ZM['x'][1]), aicc_index)
+
+def Z_ZM_bootstrap(Y, n_boot = 1000, seed = None, ci = 95, n_jobs = 1, chunksize = 16):
+    '''
+    bootstrap confidence intervals of Zipf and Zipf-Mandelbrot parameters, Y = Two_to_One(y) as Z_ZM_choose()
+    
+    Each replicate draws sum(freq) samples multinomially from the observed frequency vector,
+    rebuilds the FRD (rank by resampled frequency, zero frequencies dropped) and refits it with ZipfFitter.
+    Every replicate gets an independent stream spawned from np.random.SeedSequence(seed),
+    so the result is reproducible and does not depend on n_jobs.
+    
+    n_boot: number of replicates
+    ci: confidence level (%), percentile intervals
+    n_jobs: number of worker processes, n_jobs = 1 runs replicates one by one
+    chunksize: number of replicates sent to a worker at once
+    
+    return boot: dict
+        boot['b_Z'], boot['b_ZM'], boot['c_ZM']: (low, high)
+        boot['P_Z'], boot['P_ZM']: frequency that AICc chooses Zipf / Zipf-Mandelbrot
+        boot['n_dropped']: number of replicates whose Zipf-Mandelbrot fit failed (not converged or out of domain),
+            they are left out of the intervals of b_ZM, c_ZM and of P_Z, P_ZM
+        boot['samples']: np.array, shape = (n_boot, 4), rows = (b_Z, b_ZM, c_ZM, aicc_index)
+    '''
+    freq = np.asarray(One_to_Two(Y)[1], dtype = float)
+    seeds = np.random.SeedSequence(seed).spawn(n_boot)
+    if n_jobs > 1:
+        with ProcessPoolExecutor(n_jobs) as executor:
+            rows = list(executor.map(Z_ZM_replicate, [freq]*n_boot, seeds, chunksize = chunksize))
+    else:
+        rows = [Z_ZM_replicate(freq, sd) for sd in seeds]
+    samples = np.array(rows, dtype = float).reshape(-1, 4)
+    
+    q = [(100 - ci)/2, 100 - (100 - ci)/2]
+    boot = {}
+    boot['b_Z'] = tuple(np.nanpercentile(samples[:, 0], q))
+    boot['b_ZM'] = tuple(np.nanpercentile(samples[:, 1], q))
+    boot['c_ZM'] = tuple(np.nanpercentile(samples[:, 2], q))
+    ok = ~np.isnan(samples[:, 3])
+    boot['P_Z'] = float(np.mean(samples[ok, 3] == 0)) if ok.any() else np.nan
+    boot['P_ZM'] = float(np.mean(samples[ok, 3] == 1)) if ok.any() else np.nan
+    boot['n_dropped'] = int(np.sum(~ok))
+    if boot['n_dropped'] > 0:
+        print('%d of %d replicates dropped: Zipf-Mandelbrot fit failed' % (boot['n_dropped'], n_boot))
+    boot['samples'] = samples
+    return boot
+
+def Zipf_tail(freq, r_min):
+    #fit Zipf on ranks >= r_min, freq[i] = frequency of rank i+1, return (b_Z, neg_L), nan if the tail is empty
+    if freq[r_min - 1:].sum() == 0:
+        return np.nan, np.nan
+    k = np.arange(r_min, len(freq) + 1)
+    res = ZipfFitter(k, freq[r_min - 1:]).fit_Zipf()
+    return float(res['x'][0]), float(res['fun'])
+
+def KS_tail(freq, r_min, b, max_entries = 2*10**7):
+    '''
+    KS distance between the empirical CDF of ranks >= r_min and the fitted Zipf CDF, for every candidate r_min at once.
+    The empirical tail CDFs all come from one cumulative sum of freq,
+    the model CDFs are cumulative sums of a (candidate * rank) array, computed chunk by chunk (<= max_entries entries).
+    
+    freq: frequency of rank 1, 2, ..., V
+    r_min, b: np.array, candidate cutoffs and their fitted exponents
+    return D: np.array, KS distance of every candidate
+    '''
+    freq = np.asarray(freq, dtype = float)
+    r_min = np.asarray(r_min, dtype = int)
+    b = np.asarray(b, dtype = float)
+    V = len(freq)
+    k = np.arange(1, V + 1, dtype = float)
+    C = np.cumsum(freq)
+    D = np.zeros(len(r_min))
+    step = max(1, max_entries // V)
+    for i in range(0, len(r_min), step):
+        r, bb = r_min[i:i + step], b[i:i + step]
+        mask = k[None, :] >= r[:, None]
+        p = np.where(mask, k[None, :] ** -bb[:, None], 0)
+        model = np.cumsum(p, axis = 1) / p.sum(axis = 1)[:, None]
+        base = np.where(r > 1, C[r - 2], 0) #sum of freq below r_min
+        emp = (C[None, :] - base[:, None]) / (C[-1] - base)[:, None]
+        D[i:i + step] = np.max(np.where(mask, np.abs(emp - model), 0), axis = 1)
+    return D
+
+def Zipf_scan(freq, candidates = None, n_candidates = 50, min_tail = 10, n_jobs = 1):
+    '''
+    fit Zipf on ranks >= r_min for every candidate r_min, and evaluate their KS distances
+    
+    freq: frequency of rank 1, 2, ..., V
+    candidates: list of r_min, default = n_candidates log-spaced ranks in [1, r_max - min_tail],
+        r_max = the first rank of the lowest frequency. The plateau of the lowest frequency (EX: hapax) is flat,
+        any tail inside it is fitted perfectly by b = 0 and would always win the KS test.
+    n_jobs: number of worker processes used by the MLE refits
+    
+    return scan: dict, scan['r_min'], scan['b_Z'], scan['neg_L'], scan['KS']: np.array, scan['best']: index of min KS
+    '''
+    freq = np.asarray(freq, dtype = float)
+    if candidates is None:
+        r_max = np.argmax(freq == freq[freq > 0].min()) + 1
+        r_max = max(1, r_max - min_tail)
+        candidates = np.unique(np.geomspace(1, r_max, n_candidates).astype(int))
+    candidates = np.asarray(candidates, dtype = int)
+    
+    if n_jobs > 1:
+        with ProcessPoolExecutor(n_jobs) as executor:
+            fits = list(executor.map(Zipf_tail, [freq]*len(candidates), candidates))
+    else:
+        fits = [Zipf_tail(freq, r) for r in candidates]
+    fits = np.array(fits, dtype = float).reshape(-1, 2)
+    
+    scan = {}
+    scan['r_min'] = candidates
+    scan['b_Z'] = fits[:, 0]
+    scan['neg_L'] = fits[:, 1]
+    scan['KS'] = KS_tail(freq, candidates, fits[:, 0])
+    scan['best'] = int(np.nanargmin(scan['KS']))
+    return scan
+
+def xmin_replicate(freq, r_min, b, candidates, n_candidates, min_tail, seed):
+    #one semi-parametric bootstrap replicate of Zipf_xmin(): return min KS of the synthetic FRD
+    #candidates = None chooses the candidates of the synthetic FRD itself, as the scan of the data does
+    rng = np.random.default_rng(seed)
+    N = int(freq.sum())
+    n_head = int(freq[:r_min - 1].sum())
+    k = np.arange(r_min, len(freq) + 1)
+    p = k ** -b
+    n_h = rng.binomial(N, n_head / N)
+    head = rng.multinomial(n_h, freq[:r_min - 1] / n_head) if n_head > 0 else np.zeros(0)
+    tail = rng.multinomial(N - n_h, p / p.sum())
+    #rank the synthetic counts as the data: zero frequencies dropped, sorted from big to small
+    f = np.concatenate([head, tail])
+    f = np.sort(f[f > 0])[::-1]
+    scan = Zipf_scan(f, candidates, n_candidates, min_tail)
+    return scan['KS'][scan['best']]
+
+def Zipf_xmin(Y, candidates = None, n_candidates = 50, min_tail = 10, n_boot = 0, seed = None, n_jobs = 1):
+    '''
+    choose the lower cutoff rank_m of Zipf by minimizing the KS distance (Clauset-style), Y = Two_to_One(y) as Z_ZM_choose()
+    
+    1. Zipf_scan(): fit Zipf on ranks >= r_min for every candidate, the cutoff with the smallest KS distance is chosen
+    2. Zipf vs Zipf-Mandelbrot on the chosen tail by AICc_choose()
+    3. if n_boot > 0, p-value by semi-parametric bootstrap: 
+       ranks < r_min are resampled from data, ranks >= r_min from the fitted Zipf, the synthetic counts are ranked
+       (zero frequencies dropped, sorted from big to small) and the whole scan is repeated, candidates included.
+       p-value = fraction of replicates whose KS >= KS of data. 
+       Replicates run in n_jobs processes, each with a stream spawned from np.random.SeedSequence(seed)
+    
+    return result: dict
+        result['r_min'], result['a_Z'], result['b_Z'], result['KS']: the chosen cutoff and its Zipf fit
+        result['aicc_index'], result['aicc']: return of AICc_choose() on the tail, 0 = Zipf, 1 = Zipf-Mandelbrot
+            (AICc of Zipf-Mandelbrot is inf if its fit fails)
+        result['p_value']: nan if n_boot = 0
+        result['scan']: return of Zipf_scan()
+    '''
+    y = One_to_Two(Y)
+    rank = np.asarray(y[0], dtype = int)
+    freq = np.zeros(rank.max())
+    freq[rank - 1] = y[1]
+    
+    scan = Zipf_scan(freq, candidates, n_candidates, min_tail, n_jobs)
+    best = scan['best']
+    r_min, b_Z, KS = int(scan['r_min'][best]), scan['b_Z'][best], scan['KS'][best]
+    
+    fitter = ZipfFitter(np.arange(r_min, len(freq) + 1), freq[r_min - 1:])
+    #bounded as Z_ZM_replicate(): c_ZM <= -x_min makes ln(r + c) nan
+    res_ZM = fitter.fit_Zipf_Mandelbrot(bounds = bounds_Zipf_Mandelbrot(fitter.x_min, fitter.x_max))
+    L_ZM = res_ZM.fun if np.isfinite(res_ZM.fun) else np.inf #Zipf-Mandelbrot fails on nearly flat tails
+    aicc_index, aicc = AICc_choose([scan['neg_L'][best], L_ZM], [1, 2], fitter.N)
+    
+    p_value = np.nan
+    if n_boot > 0:
+        seeds = np.random.SeedSequence(seed).spawn(n_boot)
+        args = ([freq]*n_boot, [r_min]*n_boot, [b_Z]*n_boot, [candidates]*n_boot, [n_candidates]*n_boot, [min_tail]*n_boot, seeds)
+        if n_jobs > 1:
+            with ProcessPoolExecutor(n_jobs) as executor:
+                KS_boot = np.array(list(executor.map(xmin_replicate, *args)))
+        else:
+            KS_boot = np.array([xmin_replicate(*a) for a in zip(*args)])
+        p_value = float(np.mean(KS_boot >= KS))
+    
+    result = {}
+    result['r_min'] = r_min
+    result['a_Z'] = float(fitter.a_Zipf(b_Z))
+    result['b_Z'] = float(b_Z)
+    result['KS'] = float(KS)
+    result['aicc_index'] = aicc_index
+    result['aicc'] = aicc
+    result['p_value'] = p_value
+    result['scan'] = scan
+    return result
+
+class RankModel:
+    '''
+    A discrete model of ranks x_min, ..., x_max for model_choose(): P(k) = a * w(k), a = 1 / sum w(k)
+    
+    name: str
+    para: tuple of str, names of the parameters
+    log_w(k, theta, x_max): return (log w(k), d log w(k) / d theta), shape = (len(k),), (len(theta), len(k))
+    theta_0(fitter): initial guess from a ZipfFitter of the data
+    bounds(x_min, x_max): bounds of theta for minimize(method = 'L-BFGS-B')
+    
+    Every model only defines log w and its gradient, the normalized "negative" log likelihood and its exact gradient
+    are computed by neg_L(). log_w, theta_0 and bounds should be module-level functions, so that a model can be sent to worker processes.
+    '''
+    def __init__(self, name, para, log_w, theta_0, bounds):
+        self.name = name
+        self.para = para
+        self.log_w = log_w
+        self.theta_0 = theta_0
+        self.bounds = bounds
+    
+    def neg_L(self, theta, fitter):
+        #L = -sum(f log w(r)) + N log sum(w(k)), dL/dtheta = -sum(f dlog w(r)) + N * E_k[dlog w(k)]
+        with np.errstate(invalid = 'ignore', divide = 'ignore', over = 'ignore'):
+            lw_r, dlw_r = self.log_w(fitter.rank, theta, fitter.x_max)
+            lw_k, dlw_k = self.log_w(fitter.k, theta, fitter.x_max)
+            m = lw_k.max()
+            w = np.exp(lw_k - m)
+            Z = w.sum()
+            L = -np.sum(fitter.freq * lw_r) + fitter.N * (m + np.log(Z))
+            grad = -dlw_r @ fitter.freq + fitter.N * (dlw_k @ w) / Z
+        if not np.isfinite(L):
+            return np.inf, np.zeros(len(theta))
+        return L, grad
+    
+    def fit(self, fitter):
+        #return (theta, a, neg_L), a = 1 / sum w(k)
+        res = minimize(self.neg_L, self.theta_0(fitter), args = (fitter,), jac = True,
+                       method = 'L-BFGS-B', bounds = self.bounds(fitter.x_min, fitter.x_max))
+        lw_k = self.log_w(fitter.k, res.x, fitter.x_max)[0]
+        m = lw_k.max()
+        a = np.exp(-m) / np.sum(np.exp(lw_k - m))
+        return tuple(float(t) for t in res.x), float(a), float(res.fun)
+
+def log_w_Zipf(k, theta, x_max):
+    #w = k^-b
+    b, = theta
+    ln_k = np.log(k)
+    return -b * ln_k, np.array([-ln_k])
+
+def log_w_Zipf_Mandelbrot(k, theta, x_max):
+    #w = (k + c)^-b
+    b, c = theta
+    ln_kc = np.log(k + c)
+    return -b * ln_kc, np.array([-ln_kc, -b / (k + c)])
+
+def log_w_log_normal(k, theta, x_max):
+    #discrete log-normal, w = exp(-(ln k - mu)^2 / 2 sigma^2) / k
+    mu, sigma = theta
+    ln_k = np.log(k)
+    z = (ln_k - mu) / sigma
+    return -ln_k - z**2 / 2, np.array([z / sigma, z**2 / sigma])
+
+def log_w_cutoff(k, theta, x_max):
+    #power law with exponential cutoff, w = k^-b exp(-lambda k / x_max), lambda is in unit of 1 / x_max
+    b, lam = theta
+    ln_k = np.log(k)
+    u = k / x_max
+    return -b * ln_k - lam * u, np.array([-ln_k, -u])
+
+def log_w_double(k, theta, x_max):
+    #double power law with a continuous break at k_b, w = k^-b1 (k <= k_b), k_b^(b2 - b1) k^-b2 (k > k_b)
+    b1, b2, k_b = theta
+    ln_k = np.log(k)
+    ln_b = np.log(k_b)
+    high = k > k_b
+    lw = np.where(high, -b2 * ln_k + (b2 - b1) * ln_b, -b1 * ln_k)
+    d_b1 = np.where(high, -ln_b, -ln_k)
+    d_b2 = np.where(high, ln_b - ln_k, 0)
+    d_kb = np.where(high, (b2 - b1) / k_b, 0)
+    return lw, np.array([d_b1, d_b2, d_kb])
+
+def log_w_stretched(k, theta, x_max):
+    #stretched exponential, w = k^(beta - 1) exp(-(lambda k / x_max)^beta), lambda is in unit of 1 / x_max
+    beta, lam = theta
+    ln_k = np.log(k)
+    u = lam * k / x_max
+    u_beta = u ** beta
+    return (beta - 1) * ln_k - u_beta, np.array([ln_k - u_beta * np.log(u), -beta * u_beta / lam])
+
+def theta_0_Zipf(fitter):
+    return (fitter.b_0(),)
+
+def theta_0_Zipf_Mandelbrot(fitter):
+    return (fitter.b_0(), 0)
+
+def theta_0_log_normal(fitter):
+    #mean and std of ln r weighted by frequency
+    mu = fitter.S_ln / fitter.N
+    sigma = np.sqrt(np.sum(fitter.freq * (np.log(fitter.rank) - mu)**2) / fitter.N)
+    return (mu, max(sigma, 0.1))
+
+def theta_0_cutoff(fitter):
+    return (fitter.b_0(), 1)
+
+def theta_0_double(fitter):
+    b = fitter.b_0()
+    return (0.8 * b, 1.2 * b, np.sqrt(fitter.x_min * fitter.x_max))
+
+def theta_0_stretched(fitter):
+    return (0.5, 1)
+
+def bounds_free(x_min, x_max):
+    return [(None, None)]
+
+def bounds_Zipf_Mandelbrot(x_min, x_max):
+    return [(None, None), (1e-6 - x_min, None)]
+
+def bounds_log_normal(x_min, x_max):
+    return [(None, None), (1e-3, None)]
+
+def bounds_cutoff(x_min, x_max):
+    return [(None, None), (0, None)]
+
+def bounds_double(x_min, x_max):
+    return [(None, None), (None, None), (x_min, x_max)]
+
+def bounds_stretched(x_min, x_max):
+    return [(1e-3, None), (1e-6, None)]
+
+model_registry = {}
+
+def register_model(model):
+    #add a RankModel to model_registry, a model with the same name is replaced
+    model_registry[model.name] = model
+
+register_model(RankModel('Zipf', ('b',), log_w_Zipf, theta_0_Zipf, bounds_free))
+register_model(RankModel('Zipf-Mandelbrot', ('b', 'c'), log_w_Zipf_Mandelbrot, theta_0_Zipf_Mandelbrot, bounds_Zipf_Mandelbrot))
+register_model(RankModel('log-normal', ('mu', 'sigma'), log_w_log_normal, theta_0_log_normal, bounds_log_normal))
+register_model(RankModel('cutoff', ('b', 'lambda'), log_w_cutoff, theta_0_cutoff, bounds_cutoff))
+register_model(RankModel('double', ('b1', 'b2', 'k_b'), log_w_double, theta_0_double, bounds_double))
+register_model(RankModel('stretched', ('beta', 'lambda'), log_w_stretched, theta_0_stretched, bounds_stretched))
+
+def fit_model(model, rank, freq):
+    #fit one RankModel, return (theta, a, neg_L), nan if the fit fails
+    try:
+        return model.fit(ZipfFitter(rank, freq))
+    except (ValueError, FloatingPointError) as e:
+        print('%s failed: %s' % (model.name, e))
+        return (np.nan,) * len(model.para), np.nan, np.nan
+
+def model_choose(Y, models = None, criterion = 'AICc', n_jobs = 1):
+    '''
+    fit several models of model_registry to one FRD and rank them, Y = Two_to_One(y) as Z_ZM_choose()
+    
+    models: list of names in model_registry, default = all registered models
+        'Zipf', 'Zipf-Mandelbrot', 'log-normal', 'cutoff' (power law with exponential cutoff),
+        'double' (double power law), 'stretched' (stretched exponential)
+    criterion: 'AICc' uses AICc_choose(), 'AIC' uses AIC_choose()
+    n_jobs: number of worker processes, every model is fitted in its own task
+    
+    return best, result
+        best: name of the best model
+        result: dict, result[name] = {'para': dict of theta, 'a': normalization, 'neg_L': "negative" log likelihood, 'IC': AICc or AIC}
+            a failed fit has IC = inf
+    '''
+    y = One_to_Two(Y)
+    rank = np.asarray(y[0], dtype = float)
+    freq = np.asarray(y[1], dtype = float)
+    if models is None:
+        models = list(model_registry)
+    chosen = [model_registry[name] for name in models]
+    
+    if n_jobs > 1:
+        with ProcessPoolExecutor(n_jobs) as executor:
+            fits = list(executor.map(fit_model, chosen, [rank]*len(chosen), [freq]*len(chosen)))
+    else:
+        fits = [fit_model(model, rank, freq) for model in chosen]
+    
+    L = [f[2] if np.isfinite(f[2]) else np.inf for f in fits]
+    k = [len(model.para) for model in chosen]
+    if criterion == 'AICc':
+        index, IC = AICc_choose(L, k, freq.sum())
+    else:
+        index, IC = AIC_choose(L, k)
+    
+    result = {}
+    for model, (theta, a, neg_L), ic in zip(chosen, fits, IC):
+        result[model.name] = {'para': dict(zip(model.para, theta)), 'a': a, 'neg_L': neg_L, 'IC': ic}
+    best = chosen[index].name
+    print('the best fits is model %s' % best)
+    return best, result
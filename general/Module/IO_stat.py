@@ -86,10 +86,20 @@ This module is used to save and read parameters of GLC.
     The format string is used to present significant figures
 
 
+save_parameters() and read_parameters() keep every parameter as a python literal in a text file.
+save_store() and read_store() keep them in one binary file:
+    b'GLCSTORE' + header length (8 bytes, little endian) + JSON header + aligned binary blocks
+The small parameters are in the JSON header. The long numeric lists and arrays (RRD_coordinate, glu, R_dist of Rg)
+are saved as raw NumPy blocks, which read_store() opens lazily with np.memmap.
+So a table of many corpora (see store_table()) only parses the headers.
 """
 
 from ast import literal_eval
 import re
+import os
+import json
+import numpy as np
+import pandas as pd
 
 check_list = ['FRD_block', 'RRD_coordinate', 'Allo_fit', 'Chain_fit', 'glu', 'Rg', 'fit_para_best', 'degree_component']
 '''
@@ -97,6 +107,7 @@ PS: We suggest that
 1. save 'RRD_coordinate' and 'glu' in coor_XXX.txt
 2. save other parameters in para_XXX.txt 
 since the former is too large when read the txt file.
+save_store() keeps all of them in one para_XXX.glc, where the former are binary blocks.
 '''
 
 
@@ -132,3 +143,184 @@ def read_parameters(para_filename, Path = ''):
             data_set[label_name] = literal_eval(i)
     f.close()
     return data_set
+
+
+MAGIC = b'GLCSTORE'
+ALIGN = 64 #every binary block starts at a multiple of ALIGN bytes
+
+
+def data_start(n):
+    #position of the first binary block, the header is n bytes
+    return -(-(len(MAGIC) + 8 + n) // ALIGN) * ALIGN
+
+def to_block(x, min_block):
+    #list/tuple/np.array of numbers (or of equal-length rows of numbers) -> np.array, None if x should stay in the header
+    if isinstance(x, np.ndarray):
+        return x if x.dtype.kind in 'iuf' and x.size > 0 else None
+    if len(x) < max(min_block, 1):
+        return None
+    flat = x
+    if isinstance(x[0], (list, tuple)):
+        if len(set(type(r) for r in x)) > 1:
+            return None
+        flat = [v for r in x for v in r]
+    kinds = set(type(v) for v in flat)
+    if kinds <= {int, np.int32, np.int64}:
+        dtype = np.int64
+    elif kinds <= {float, np.float32, np.float64}:
+        dtype = np.float64
+    else:
+        return None
+    try:
+        arr = np.asarray(x, dtype = dtype)
+    except ValueError: #rows of different lengths
+        return None
+    return arr if arr.ndim == (2 if flat is not x else 1) else None
+
+def encode_node(x, blocks, min_block):
+    #python object -> JSON node, the long numeric sequences are appended to blocks
+    if isinstance(x, (list, tuple, np.ndarray)):
+        arr = to_block(x, min_block)
+        if arr is not None:
+            node = {'block': len(blocks), 'as': 'ndarray' if isinstance(x, np.ndarray) else type(x).__name__}
+            if arr.ndim == 2 and not isinstance(x, np.ndarray):
+                node['row'] = type(x[0]).__name__
+            blocks.append(arr)
+            return node
+        kind = 'list' if isinstance(x, np.ndarray) else type(x).__name__
+        return {kind: [encode_node(v, blocks, min_block) for v in x]}
+    if isinstance(x, dict):
+        return {'dict': [[encode_node(k, blocks, min_block), encode_node(v, blocks, min_block)] for k, v in x.items()]}
+    if isinstance(x, (set, frozenset)):
+        return {'set': [encode_node(v, blocks, min_block) for v in x]}
+    if isinstance(x, np.generic):
+        return x.item()
+    if x is None or isinstance(x, (bool, int, float, str)):
+        return x
+    raise TypeError('cannot save %s' % type(x))
+
+def decode_node(node, f, header, lazy):
+    #JSON node -> python object, see encode_node()
+    if not isinstance(node, dict):
+        return node
+    if 'block' in node:
+        b = header['blocks'][node['block']]
+        arr = np.memmap(f, dtype = b['dtype'], mode = 'r', offset = header['start'] + b['offset'], shape = tuple(b['shape']))
+        if lazy or node['as'] == 'ndarray':
+            return arr if lazy else np.array(arr)
+        if 'row' in node:
+            row = tuple if node['row'] == 'tuple' else list
+            x = [row(r) for r in arr.tolist()]
+        else:
+            x = arr.tolist()
+        return tuple(x) if node['as'] == 'tuple' else x
+    (kind, value), = node.items()
+    if kind == 'dict':
+        return {decode_node(k, f, header, lazy): decode_node(v, f, header, lazy) for k, v in value}
+    x = [decode_node(v, f, header, lazy) for v in value]
+    return {'list': list, 'tuple': tuple, 'set': set}[kind](x)
+
+def save_store(para_filename, data_set, Path = '', min_block = 32):
+    '''save data_set in the binary format of this module (see the docstring)
+
+    ---Parameters
+    1. para_filename, Path: str
+        the file is Path + para_filename, EX: 'para_XXX.glc'
+
+    2. data_set: dict, {parameter: value}
+        parameter should be in check_list
+
+    3. min_block: int, default = 32
+        a list or tuple of at least min_block numbers (or rows of numbers) is saved as a binary block,
+        np.array is always saved as a binary block
+    '''
+    for d in data_set:
+        if d not in check_list:
+            print('unknown parameter: %s' % d)
+    blocks = []
+    header = {'keys': {d: encode_node(data_set[d], blocks, min_block) for d in data_set}, 'blocks': []}
+    #offsets are counted from the first multiple of ALIGN after the header
+    offset = 0
+    for arr in blocks:
+        header['blocks'].append({'dtype': arr.dtype.str, 'shape': list(arr.shape), 'offset': offset})
+        offset += -(-arr.nbytes // ALIGN) * ALIGN
+    text = json.dumps(header, ensure_ascii = False).encode('utf-8')
+    start = data_start(len(text))
+
+    path = Path + para_filename
+    #write to a temporary file first, so that a reader never sees half a file
+    with open(path + '.tmp', 'wb') as f:
+        f.write(MAGIC)
+        f.write(len(text).to_bytes(8, 'little'))
+        f.write(text)
+        for arr, b in zip(blocks, header['blocks']):
+            f.seek(start + b['offset'])
+            f.write(np.ascontiguousarray(arr).tobytes())
+    os.replace(path + '.tmp', path)
+
+def read_header(para_filename, Path = ''):
+    #the JSON header of a file written by save_store(), no binary block is read
+    with open(Path + para_filename, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError('%s is not written by save_store()' % (Path + para_filename))
+        n = int.from_bytes(f.read(8), 'little')
+        header = json.loads(f.read(n).decode('utf-8'))
+    header['start'] = data_start(n)
+    return header
+
+def read_store(para_filename, Path = '', keys = None, lazy = True):
+    '''read a file written by save_store()
+
+    ---Parameters
+    1. keys: list of str, default = None
+        read only these parameters, None reads all of them
+    
+    2. lazy: bool, default = True
+        if True, the binary blocks are returned as read-only np.memmap (loaded from disk only when used)
+        else they are returned as the saved python objects, the same as read_parameters() of a text file
+
+    ---Return
+        data_set: dict, {parameter: value}
+    '''
+    header = read_header(para_filename, Path)
+    if keys is None:
+        keys = list(header['keys'])
+    return {d: decode_node(header['keys'][d], Path + para_filename, header, lazy) for d in keys}
+
+def store_table(para_filenames, Path = '', keys = None, max_len = 4):
+    '''one row per file of the small parameters of save_store() files, the binary blocks are not read
+
+    ---Input
+        para_filenames: list of str
+
+    ---Parameters
+    1. keys: list of str, default = None
+        the parameters of the table, None for all but RRD_coordinate and glu
+
+    2. max_len: int, default = 4
+        a list or tuple is split into columns only if it has at most max_len elements, EX: FRD_block['ab'], popt
+
+    ---Return
+        table: pandas.DataFrame, index = para_filenames
+            a column for every scalar, EX: FRD_block.ab.1 is b_Z of FRD_block['ab']
+    '''
+    rows = []
+    for name in para_filenames:
+        header = read_header(name, Path)
+        row = {}
+        def flatten(node, label):
+            if not isinstance(node, dict):
+                row[label] = node
+            elif 'dict' in node:
+                for k, v in node['dict']:
+                    flatten(v, '%s.%s' % (label, k))
+            elif 'block' not in node:
+                (kind, value), = node.items()
+                if len(value) <= max_len:
+                    for i, v in enumerate(value):
+                        flatten(v, '%s.%d' % (label, i))
+        for d in header['keys'] if keys is None else keys:
+            if d in header['keys'] and (keys is not None or d not in ['RRD_coordinate', 'glu']):
+                flatten(header['keys'][d], d)
+        rows.append(row)
+    return pd.DataFrame(rows, index = para_filenames)
@@ -12,8 +12,47 @@ import matplotlib.pyplot as plt
 from scipy.optimize import minimize
 from scipy.optimize import curve_fit
 
- 
-def Allo_plot(name, compo, x_pos = 0, y_pos = 0, FORMAT = 'png', Path = ''):
+
+def allo(y, a, b):
+    return (a * np.log(y) + b) ** 2
+
+def chain(x, a, b):
+    return (a * np.log(x) + b)
+
+def fit_log_linear(x, z, w = None):
+    #closed-form (weighted) least squares of z = a ln x + b, every row is multiplied by w, return np.array([a, b])
+    X = np.column_stack([np.log(x), np.ones(len(x))])
+    if w is not None:
+        X, z = X * w[:, None], z * w
+    return np.linalg.lstsq(X, z, rcond = None)[0]
+
+def fit_allo(rank, allocation, refine = False):
+    '''fit Allo(y') = (a ln y' + b)^2
+    sqrt(Allo) = a ln y' + b is linear in (a, b), so it is solved by least squares in closed form.
+    The rows are weighted by sqrt(Allo): Allo - s^2 ~ 2 sqrt(Allo) (sqrt(Allo) - s) for s = a ln y' + b,
+    so the weighted fit follows the least squares of curve_fit() on Allo itself.
+    (a, b) and (-a, -b) are the same curve, the closed form gives the branch a ln y' + b >= 0.
+    If refine, the closed form is used as the initial guess of curve_fit() on Allo itself.
+    '''
+    rank = np.asarray(rank, dtype = float)
+    allocation = np.asarray(allocation, dtype = float)
+    popt = fit_log_linear(rank, np.sqrt(allocation), np.sqrt(allocation))
+    if refine:
+        popt, pcov = curve_fit(allo, rank, allocation, p0 = popt)
+    return popt
+
+def fit_chain(rank, chains, refine = False):
+    '''fit Chain(x') = a ln x' + b, which is linear in (a, b) and solved by least squares in closed form.
+    curve_fit() gives the same optimum, it is only run if refine.
+    '''
+    rank = np.asarray(rank, dtype = float)
+    chains = np.asarray(chains, dtype = float)
+    popt = fit_log_linear(rank, chains)
+    if refine:
+        popt, pcov = curve_fit(chain, rank, chains, p0 = popt)
+    return popt
+
+def Allo_plot(name, compo, x_pos = 0, y_pos = 0, FORMAT = 'png', Path = '', refine = False, plot = True):
     '''draw FRD plot of blocks and components
 
     ---Input
@@ -38,6 +77,13 @@ def Allo_plot(name, compo, x_pos = 0, y_pos = 0, FORMAT = 'png', Path = ''):
         if Path == np.nan, no figure will be saved (just show it)
         else, the figure will be saved according to Path
     
+    4. refine: bool
+        the closed-form least squares of fit_allo() is used by default,
+        if True, it is refined by curve_fit()
+    
+    5. plot: bool
+        if False, only Allo_fit is computed and no figure is drawn
+    
     ---Output
         figure of allocation distribution
     
@@ -51,15 +97,8 @@ def Allo_plot(name, compo, x_pos = 0, y_pos = 0, FORMAT = 'png', Path = ''):
 
     #use OLS to get the fitting parameter
     #-----------------------------------------
-    def allo(y, a, b):
-        return (a * np.log(y) + b) ** 2
-
-    popt, pcov = curve_fit(allo, compo['compoRank'], reCompo['#allocations'])
+    popt = fit_allo(compo['compoRank'], reCompo['#allocations'], refine)
     #popt is the optimal values for the parameters (a,b)
-    theo = allo(compo['compoRank'], *popt)
-    fig, ax = plt.subplots()
-    plt.plot(compo['compoRank'], theo, 'g--')
-    plt.plot(reCompo['#allocations'], 'ro', label = 'compo', markersize = 4)
     
     #the following code deal with significant figures of fitting parameters
     #the tutor of significant figures: https://www.usna.edu/ChemDept/_files/documents/manual/apdxB.pdf
@@ -74,6 +113,10 @@ def Allo_plot(name, compo, x_pos = 0, y_pos = 0, FORMAT = 'png', Path = ''):
     # https://docs.python.org/3/tutorial/floatingpoint.html
     A = format(abs(popt[0]), '#.%dg' % a_dig)  # give a_dig significant digits
     B = format(popt[1], '#.%dg' % b_dig)  # give b_dig significant digits
+    Allo_fit = (A, B)
+    if not plot:
+        return Allo_fit
+    
     if 'e' in A: #make scientific notation more beautiful
         A_text = A.split('e')[0] + '\\times 10^{' + str(int(A.split('e')[1])) + '}'
     elif A[-1] == '.':
@@ -86,6 +129,11 @@ def Allo_plot(name, compo, x_pos = 0, y_pos = 0, FORMAT = 'png', Path = ''):
         B_text = B[:-1]
     else:
         B_text = B
+    
+    theo = allo(compo['compoRank'], *popt)
+    fig, ax = plt.subplots()
+    plt.plot(compo['compoRank'], theo, 'g--')
+    plt.plot(reCompo['#allocations'], 'ro', label = 'compo', markersize = 4)
         
     #a perfect solution to text wrap!!
     #https://stackoverflow.com/questions/2660319/putting-newline-in-matplotlib-label-with-tex-in-python
@@ -125,10 +173,9 @@ def Allo_plot(name, compo, x_pos = 0, y_pos = 0, FORMAT = 'png', Path = ''):
     except:
         plt.show()
     
-    Allo_fit = (A, B)
     return Allo_fit
         
-def Chain_plot(name, block, x_pos = 0, y_pos = 0, FORMAT = 'png', Path = ''):
+def Chain_plot(name, block, x_pos = 0, y_pos = 0, FORMAT = 'png', Path = '', refine = False, plot = True):
     '''draw allocation-rank plot 
 
     ---Input
@@ -153,6 +200,13 @@ def Chain_plot(name, block, x_pos = 0, y_pos = 0, FORMAT = 'png', Path = ''):
         if Path == np.nan, no figure will be saved (just show it)
         else, the figure will be saved according to Path
     
+    4. refine: bool
+        the closed-form least squares of fit_chain() is used by default,
+        if True, it is refined by curve_fit()
+    
+    5. plot: bool
+        if False, only Chain_fit and U_Chain are computed and no figure is drawn
+    
     ---Output
         figure of chain distribution
     
@@ -167,17 +221,8 @@ def Chain_plot(name, block, x_pos = 0, y_pos = 0, FORMAT = 'png', Path = ''):
 
     #use OLS to get the fitting parameter
     #-----------------------------------------
-    def chain(x, a, b):
-        return (a * np.log(x) + b)
-
-    popt, pcov = curve_fit(chain, block['blockRank'], reBlock['#chains'])
+    popt = fit_chain(block['blockRank'], reBlock['#chains'], refine)
     #popt is the optimal values for the parameters (a,b)
-    theo = chain(block['blockRank'], *popt)
-    fig, ax = plt.subplots()
-    plt.plot(block['blockRank'], theo, 'g--')
-    plt.plot(reBlock['#chains'], 'ro', label = 'block', markersize = 4)
-
-
     
     #the following code deal with significant figures of fitting parameters
     #the tutor of significant figures: https://www.usna.edu/ChemDept/_files/documents/manual/apdxB.pdf
@@ -192,6 +237,11 @@ def Chain_plot(name, block, x_pos = 0, y_pos = 0, FORMAT = 'png', Path = ''):
     # https://docs.python.org/3/tutorial/floatingpoint.html
     A = format(abs(popt[0]), '#.%dg' % a_dig)  # give a_dig significant digits
     B = format(popt[1], '#.%dg' % b_dig)  # give b_dig significant digits
+    Chain_fit = (A, B)
+    U_Chain = max(reBlock['#chains'])
+    if not plot:
+        return Chain_fit, U_Chain
+    
     if 'e' in A: #make scientific notation more beautiful
         A_text = A.split('e')[0] + '\\times 10^{' + str(int(A.split('e')[1])) + '}'
     elif A[-1] == '.':
@@ -205,6 +255,11 @@ def Chain_plot(name, block, x_pos = 0, y_pos = 0, FORMAT = 'png', Path = ''):
     else:
         B_text = B
     
+    theo = chain(block['blockRank'], *popt)
+    fig, ax = plt.subplots()
+    plt.plot(block['blockRank'], theo, 'g--')
+    plt.plot(reBlock['#chains'], 'ro', label = 'block', markersize = 4)
+    
     #a perfect solution to text wrap!!
     #https://stackoverflow.com/questions/2660319/putting-newline-in-matplotlib-label-with-tex-in-python
     parameters = (r"$\gamma=%s$"
@@ -243,6 +298,4 @@ def Chain_plot(name, block, x_pos = 0, y_pos = 0, FORMAT = 'png', Path = ''):
     except:
         plt.show()
     
-    Chain_fit = (A, B)
-    U_Chain = max(reBlock['#chains'])
     return Chain_fit, U_Chain
\ No newline at end of file
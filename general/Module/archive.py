@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+'''
+@author  gmking
+
+This module is used to collect the GLC parameters of many corpora in one append-only SQLite file.
+
+Run_All.ipynb writes the results of every corpus to its own files (parameter/, SC/, fitting/, ...),
+so a table across corpora used to parse thousands of text files.
+archive_results() appends the scalars of FRD_block, Allo_fit, Chain_fit, Rg, fit_para_best and degree_component
+(see IO_stat.py for their structures) as rows of one database:
+
+    run(run_id, corpus, fingerprint, para, created)
+        one row per archived corpus, fingerprint is a hash of the parameters of the run (see fingerprint())
+    result(run_id, parameter, field, value, text)
+        one row per scalar, EX: parameter = 'FRD_block', field = 'ab.1' is b_Z of FRD_block['ab']
+        value is the number (the strings of significant figures are converted), text is the saved string
+
+Rows are never updated or deleted, the latest run of a (corpus, fingerprint) is the one with the largest run_id.
+Every call opens its own connection and writes in one transaction, so pool workers can append to the same file.
+'''
+
+import json
+import time
+import hashlib
+import sqlite3
+import pandas as pd
+
+archive_list = ['FRD_block', 'Allo_fit', 'Chain_fit', 'Rg', 'fit_para_best', 'degree_component']
+
+schema = '''
+CREATE TABLE IF NOT EXISTS run (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    corpus TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    para TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS result (
+    run_id INTEGER NOT NULL REFERENCES run(run_id),
+    parameter TEXT NOT NULL,
+    field TEXT NOT NULL,
+    value REAL,
+    text TEXT
+);
+CREATE INDEX IF NOT EXISTS run_corpus ON run(corpus, fingerprint);
+CREATE INDEX IF NOT EXISTS run_fingerprint ON run(fingerprint);
+CREATE INDEX IF NOT EXISTS result_run ON result(run_id);
+CREATE INDEX IF NOT EXISTS result_field ON result(parameter, field);
+'''
+
+
+def connect(db, timeout = 60):
+    #open db (created if missing), a writer waits up to timeout seconds for the others
+    conn = sqlite3.connect(db, timeout = timeout, isolation_level = None)
+    conn.execute('PRAGMA journal_mode = WAL') #readers do not block the writer
+    conn.execute('PRAGMA busy_timeout = %d' % (timeout * 1000))
+    conn.executescript(schema)
+    return conn
+
+def fingerprint(para):
+    '''hash of the parameters of a run, EX: the de-noising parameters of plot_g()
+
+    para: dict, the order of keys does not matter
+    return str, 16 hex digits
+    '''
+    text = json.dumps(para, sort_keys = True, default = str)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+def flatten(x, label, rows, max_len):
+    #nested dict/list/tuple -> rows of (field, value, text), a list or tuple longer than max_len (EX: R_dist) is skipped
+    if isinstance(x, dict):
+        for k, v in x.items():
+            flatten(v, '%s.%s' % (label, k) if label else str(k), rows, max_len)
+    elif isinstance(x, (list, tuple)):
+        if len(x) <= max_len:
+            for i, v in enumerate(x):
+                flatten(v, '%s.%d' % (label, i) if label else str(i), rows, max_len)
+    elif hasattr(x, 'item'): #numpy scalar
+        flatten(x.item(), label, rows, max_len)
+    elif isinstance(x, (bool, int, float)):
+        rows.append((label, float(x), None))
+    elif isinstance(x, str):
+        try:
+            rows.append((label, float(x), x))
+        except ValueError:
+            rows.append((label, None, x))
+
+def archive_results(db, corpus, data_set, para = None, max_len = 4):
+    '''append the parameters of one corpus to db
+
+    ---Input
+    1. db: str, path of the SQLite file
+
+    2. corpus: str, EX: name of Run_All.ipynb
+
+    3. data_set: dict, {parameter: value}
+        the parameters in archive_list are archived, the others (RRD_coordinate, glu) are ignored
+
+    ---Parameters
+    1. para: dict, default = None
+        the parameters of the run, saved as JSON and hashed by fingerprint()
+
+    2. max_len: int, default = 4
+        a list or tuple is split into fields only if it has at most max_len elements
+
+    ---Return
+        run_id: int
+    '''
+    para = {} if para is None else para
+    rows = []
+    for d in archive_list:
+        if d in data_set:
+            flat = []
+            flatten(data_set[d], '', flat, max_len)
+            rows += [(d,) + r for r in flat]
+
+    conn = connect(db)
+    try:
+        conn.execute('BEGIN IMMEDIATE') #take the write lock at once, so that concurrent writers queue up instead of failing
+        cur = conn.execute('INSERT INTO run (corpus, fingerprint, para, created) VALUES (?, ?, ?, ?)',
+                           (corpus, fingerprint(para), json.dumps(para, sort_keys = True, default = str), time.time()))
+        run_id = cur.lastrowid
+        conn.executemany('INSERT INTO result (run_id, parameter, field, value, text) VALUES (?, ?, ?, ?, ?)',
+                         [(run_id,) + r for r in rows])
+        conn.execute('COMMIT')
+    except BaseException:
+        #BEGIN IMMEDIATE itself can fail (EX: busy timeout), then there is nothing to roll back and the lock error is raised
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
+    return run_id
+
+def query_results(db, parameter = None, field = None, corpus = None, fingerprint = None, latest = True):
+    '''rows of db, one per scalar
+
+    ---Parameters
+    1. parameter, field, corpus, fingerprint: str or list of str, default = None
+        only the rows which match, None for all
+
+    2. latest: bool, default = True
+        if True, only the latest run of every (corpus, fingerprint)
+
+    ---Return
+        table: pandas.DataFrame, columns = run_id, corpus, fingerprint, parameter, field, value, text
+    '''
+    where, args = [], []
+    for column, x in [('r.parameter', parameter), ('r.field', field), ('u.corpus', corpus), ('u.fingerprint', fingerprint)]:
+        if x is not None:
+            x = [x] if isinstance(x, str) else list(x)
+            where.append('%s IN (%s)' % (column, ', '.join('?' * len(x))))
+            args += x
+    if latest:
+        where.append('u.run_id IN (SELECT MAX(run_id) FROM run GROUP BY corpus, fingerprint)')
+    sql = ('SELECT u.run_id, u.corpus, u.fingerprint, r.parameter, r.field, r.value, r.text '
+           'FROM result r JOIN run u ON r.run_id = u.run_id')
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    conn = connect(db)
+    try:
+        return pd.read_sql_query(sql + ' ORDER BY u.run_id', conn, params = args)
+    finally:
+        conn.close()
+
+def archive_table(db, parameter = None, corpus = None, fingerprint = None):
+    '''the latest run of every (corpus, fingerprint) as one row
+
+    ---Return
+        table: pandas.DataFrame, index = (corpus, fingerprint), a column parameter.field for every scalar
+            a field which is not a number keeps its text
+    '''
+    rows = query_results(db, parameter, None, corpus, fingerprint)
+    rows['column'] = rows['parameter'] + '.' + rows['field']
+    rows['value'] = rows['value'].astype(object).where(rows['value'].notna(), rows['text'])
+    table = rows.pivot(index = ['corpus', 'fingerprint'], columns = 'column', values = 'value')
+    table.columns.name = None
+    return table
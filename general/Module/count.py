@@ -22,7 +22,8 @@ import matplotlib.pyplot as plt
 from matplotlib import ticker
 import sys
 from .Curve_Fitting_MLE import *
-from .zipfgen import ZipfGenerator #https://medium.com/pyladies-taiwan/python-%E7%9A%84-import-%E9%99%B7%E9%98%B1-3538e74f57e3
+from .zipfgen import ZipfGenerator, RejectionInversionZipfGenerator #https://medium.com/pyladies-taiwan/python-%E7%9A%84-import-%E9%99%B7%E9%98%B1-3538e74f57e3
+from .fake import constraint_blocks
 import random
 
 
@@ -190,6 +191,67 @@ def info(file_name, encode = "UTF-8"):
     
     return data_frame, pd_compo, another_block, longest_L
 
+def resample_info(block, compo, seed = None):
+    '''multinomial bootstrap of a Book: draw len(Book) blocks from the FRD of block, 
+    then build big, compo, block, longest as info() does. Nothing is read from or written to disk.
+    
+    ---Input
+        block, compo: pandas.DataFrame
+            the return of info()
+    
+    ---Parameters
+        seed: int, np.random.SeedSequence or np.random.Generator, default = None
+            seed of the resampling
+    
+    ---Return
+        big, compo, block, longest: the same as info()
+        
+        ps: SeqOrder of the resampled blocks and components follows the original Book
+    '''
+    rng = np.random.default_rng(seed)
+    freq = block['blockFreq'].to_numpy()
+    new_freq = rng.multinomial(freq.sum(), freq / freq.sum())
+    keep = new_freq > 0
+    
+    block_freq = dict(zip(block['block'][keep], new_freq[keep]))
+    block_seq = dict(zip(block['block'], block['blockSeqOrder']))
+    compo_seq = dict(zip(compo['compo'], compo['compoSeqOrder']))
+    return info_from_counts(block_freq, block_seq, compo_seq)
+
+def info_from_counts(block_freq, block_seq = None, compo_seq = None):
+    '''build big, compo, block, longest as info() does from the frequencies of blocks, nothing is read from or written to disk.
+    Used by resample_info() and the null models of ensemble.py
+    
+    ---Input
+        block_freq: dict, {block: frequency}, the components of a block are separated by '-'
+    
+    ---Parameters
+        block_seq, compo_seq: dict, {unit: SeqOrder}, default = None
+            if None, the order of block_freq (and of the components in it) is used
+    
+    ---Return
+        big, compo, block, longest: the same as info()
+    '''
+    block_list = list(block_freq)
+    if block_seq is None:
+        block_seq = dict(zip(block_list, range(len(block_list))))
+    
+    compo_freq = {}
+    longest = 0
+    for b in block_list:
+        t = b.split('-')
+        longest = max(longest, len(t))
+        for c in t:
+            compo_freq[c] = compo_freq.get(c, 0) + block_freq[b]
+    if compo_seq is None:
+        compo_seq = dict(zip(compo_freq, range(len(compo_freq))))
+    
+    pd_block = produce_data_frame(block_list, block_freq, block_seq, "block")
+    another_block = pd_block.copy()
+    pd_compo = produce_data_frame(list(compo_freq), compo_freq, compo_seq, "compo")
+    data_frame = produce_blockRank_compoRank_frame(pd_block, pd_compo, longest)
+    return data_frame, pd_compo, another_block, longest
+
 def N_gram_info(file_name, N, encode = "UTF-8"):
     '''This is only used to analysis N-gram blocks.
         
@@ -245,7 +307,7 @@ def N_gram_info(file_name, N, encode = "UTF-8"):
     
     return data_frame, pd_compo, another_block, longest_L    
 
-def write_to_excel(big, block, compo, name):
+def write_to_excel(big, block, compo, name, top = None):
     """Save pandas dataFrame big, block, and compo as an excel file with the given filename
     
     ---Input
@@ -255,18 +317,107 @@ def write_to_excel(big, block, compo, name):
     
     
     ---Parameters
-    name: string
+    1. name: string
         the name of excel file
     
+    2. top: int, default = None
+        if not None, only the first top rows (the top-ranked ones) of every sheet are saved.
+        An excel sheet holds at most 1,048,576 rows, use write_results() for the full tables.
+    
     ---Output
         an excel file contains big, block, and compo
     
     """
-    writer = pd.ExcelWriter(name + '.xlsx')
-    big.to_excel(writer, 'RRD')
-    block.to_excel(writer, 'block')
-    compo.to_excel(writer, 'component')
-    writer.save()
+    with pd.ExcelWriter(name + '.xlsx') as writer:
+        big[:top].to_excel(writer, sheet_name = 'RRD')
+        block[:top].to_excel(writer, sheet_name = 'block')
+        compo[:top].to_excel(writer, sheet_name = 'component')
+
+def write_parquet(frames, name):
+    #frames: {sheet: pandas.DataFrame}, saved as name_sheet.parquet (needs pyarrow or fastparquet)
+    paths = []
+    for sheet, df in frames.items():
+        paths.append('%s_%s.parquet' % (name, sheet))
+        df.to_parquet(paths[-1])
+    return paths
+
+def write_feather(frames, name):
+    #frames: {sheet: pandas.DataFrame}, saved as name_sheet.feather (needs pyarrow)
+    paths = []
+    for sheet, df in frames.items():
+        paths.append('%s_%s.feather' % (name, sheet))
+        df.reset_index(drop = True).to_feather(paths[-1])
+    return paths
+
+def write_csv(frames, name):
+    #frames: {sheet: pandas.DataFrame}, saved as gzip-compressed name_sheet.csv.gz
+    paths = []
+    for sheet, df in frames.items():
+        paths.append('%s_%s.csv.gz' % (name, sheet))
+        df.to_csv(paths[-1], compression = 'gzip')
+    return paths
+
+result_writers = {'parquet': write_parquet, 'feather': write_feather, 'csv': write_csv}
+
+def write_results(big, block, compo, name, fmt = 'parquet', excel_top = None):
+    """Save pandas dataFrame big, block, and compo in a columnar file per table, for a corpus of any size
+    
+    ---Input
+    big, block, compo: pandas.DataFrame
+        Return of info()
+    
+    ---Parameters
+    1. name: string
+        the files are name_RRD, name_block and name_component + extension
+    
+    2. fmt: 'parquet', 'feather' or 'csv' (gzip-compressed), default = 'parquet'
+        key of result_writers, a writer(frames, name) -> paths added to result_writers can be used as well,
+        with a reader in result_readers for read_results()
+    
+    3. excel_top: int, default = None
+        if not None, also save the first excel_top rows of every table as name.xlsx by write_to_excel()
+    
+    ---Return
+        paths: list of str, the written files
+    """
+    if fmt not in result_writers:
+        raise ValueError('unknown format %s, result_writers has %s' % (fmt, list(result_writers)))
+    frames = {'RRD': big, 'block': block, 'component': compo}
+    paths = result_writers[fmt](frames, name)
+    if excel_top is not None:
+        write_to_excel(big, block, compo, name, excel_top)
+        paths.append(name + '.xlsx')
+    return paths
+
+def read_parquet(sheets, name):
+    #name_sheet.parquet of every sheet -> list of pandas.DataFrame
+    return [pd.read_parquet('%s_%s.parquet' % (name, sheet)) for sheet in sheets]
+
+def read_feather(sheets, name):
+    #name_sheet.feather of every sheet -> list of pandas.DataFrame
+    return [pd.read_feather('%s_%s.feather' % (name, sheet)) for sheet in sheets]
+
+def read_csv(sheets, name):
+    #name_sheet.csv.gz of every sheet -> list of pandas.DataFrame
+    #block and compo are read as str, a component can look like a number
+    return [pd.read_csv('%s_%s.csv.gz' % (name, sheet), index_col = 0, dtype = {'block': str, 'compo': str},
+                        keep_default_na = False, na_values = ['']) for sheet in sheets]
+
+result_readers = {'parquet': read_parquet, 'feather': read_feather, 'csv': read_csv}
+
+def read_results(name, fmt = 'parquet'):
+    """Read big, block, and compo saved by write_results()
+    
+    ---Parameters
+        fmt: key of result_readers, the same as write_results().
+            A format added to result_writers needs a reader(sheets, name) -> list of pandas.DataFrame in result_readers
+    
+    ---Return
+        big, block, compo: pandas.DataFrame
+    """
+    if fmt not in result_readers:
+        raise ValueError('unknown format %s, result_readers has %s' % (fmt, list(result_readers)))
+    return tuple(result_readers[fmt](['RRD', 'block', 'component'], name))
 
 def geometric_sequence(block, compo):
     '''give geometric sequence {Hn} and {Vm}
@@ -284,27 +435,15 @@ def geometric_sequence(block, compo):
       
     '''
     
-    V = [0 for i in range(len(set(block['blockFreq'])))]
-    H = [0 for i in range(len(set(compo['compoFreq'])))]
-    
-    Vf = sorted(set(block['blockFreq']))
-    Hf = sorted(set(compo['compoFreq']))
-    
-    SVT = 0
-    SHT = 0
-    
-    for i in range(len(set(block['blockFreq']))):
-        #ref: Count how many values in a list that satisfy certain condition
-        SV = sum(1 for cf in block['blockFreq'] if cf == Vf[i])
-        SVT = SVT + SV
-        V[i] = len(block['blockFreq']) - SVT
+    #V[i] = number of blocks whose frequency > the i-th smallest frequency, 
+    #counted at once from the number of blocks of every frequency
+    Vf, SV = np.unique(block['blockFreq'], return_counts = True)
+    V = [int(v) for v in len(block['blockFreq']) - np.cumsum(SV)]
     #we need to add total kinds of blocks as V_1    
     V[:0] = (max(block['blockRank']),)    
-        
-    for i in range(len(set(compo['compoFreq']))):
-        SH = sum(1 for wf in compo['compoFreq'] if wf == Hf[i])
-        SHT = SHT + SH
-        H[i] = len(compo['compoFreq']) - SHT
+    
+    Hf, SH = np.unique(compo['compoFreq'], return_counts = True)
+    H = [int(h) for h in len(compo['compoFreq']) - np.cumsum(SH)]
     #we need to add total kinds of component as H_1
     H[:0] = (max(compo['compoRank']),)
     
@@ -491,6 +630,25 @@ def N_compo_dist(name, big, longest, density = True, FORMAT = 'png', Path = ''):
     elif density == False:
         return N_dist
 
+def geometric_ratio(seq, max_range = 50):
+    '''compute-only part of which_plot(shift = 'N'): ratios seq[n+1]/seq[n] from seq[2]/seq[1]
+    
+    ---Input
+        seq: list or np.array, V or H of geometric_sequence()
+    
+    ---Parameters
+        max_range: int, see which_plot()
+    
+    ---Return
+        r: np.array, the ratios
+        MEAN, STD: float, rounded as which_plot()
+    '''
+    if len(seq) < max_range + 4:
+        max_range = len(seq) - 5
+    seq = np.asarray(seq, dtype = float)
+    r = seq[2:max_range] / seq[1:max_range - 1]
+    return r, round(np.mean(r), 3), round(np.std(r), 3)
+
 def which_plot(name, V, H, x = 'H', max_range = 50, shift = 'N', FORMAT = 'png', Path = ''):
     '''check ratio of geometric sequence {Hn} or {Vm}
 
@@ -558,8 +716,7 @@ def which_plot(name, V, H, x = 'H', max_range = 50, shift = 'N', FORMAT = 'png',
 
         elif shift != 'T': 
             SHIFT = 0
-            for i in range(1, max_range - 1): #H[0]=H_1, H[1]=H_2
-                r[i - 1] = H[i + 1]/ H[i]
+            r = geometric_ratio(H, max_range)[0] #H[0]=H_1, H[1]=H_2
         
         
         r_position = [i + 2 for i in range(len(r))] #we start from H_2
@@ -618,9 +775,7 @@ def which_plot(name, V, H, x = 'H', max_range = 50, shift = 'N', FORMAT = 'png',
         
         elif shift != 'T': 
             SHIFT = 0
-            for i in range(1, max_range - 1): #V[0]=V_1, V[1]=V_2
-                print(V[i], V[i+1])
-                r[i - 1] = V[i + 1] / V[i]
+            r = geometric_ratio(V, max_range)[0] #V[0]=V_1, V[1]=V_2
                 
         r_position = [i + 2 for i in range(len(r))] #we start from V_2
         STD = round(np.std(r), 3)
@@ -652,7 +807,7 @@ def which_plot(name, V, H, x = 'H', max_range = 50, shift = 'N', FORMAT = 'png',
         print('please chose x = \'H\' or \'V\'')
 
     
-def FRD_plot(name, block, compo, x_pos = 2, y_pos = 10, FORMAT = 'png', Path = ''):
+def FRD_plot(name, block, compo, x_pos = 2, y_pos = 10, FORMAT = 'png', Path = '', num_curve = 500):
     '''draw FRD plot of blocks and components
 
     ---Parameters
@@ -676,6 +831,9 @@ def FRD_plot(name, block, compo, x_pos = 2, y_pos = 10, FORMAT = 'png', Path = '
         if Path == np.nan, no figure will be saved (just show it)
         else, the figure will be saved according to Path
     
+    6. num_curve: int
+        number of log-spaced points used to draw the fitted curve, see Curve_Fitting_MLE.py > log_grid()
+    
     ---Output
         save or show a figure of FRD
     
@@ -712,18 +870,17 @@ def FRD_plot(name, block, compo, x_pos = 2, y_pos = 10, FORMAT = 'png', Path = '
         L += i
         T[1].append(i)
         
-    Y = Two_to_One(T)
     
     #Estimate exponent. This action can make reduce the error of initial value guess.
     freq_M, freq_m = int(max(T[1])), int(min(T[1]))
     rank_M, rank_m = int(max(T[0])), int(min(T[0]))
     b_0 = np.log(freq_M / freq_m) / np.log(rank_M / rank_m)
 
-    xdata = np.linspace(rank_m, rank_M, num = (rank_M - rank_m)*10)
+    xdata = log_grid(rank_m, rank_M, num_curve)
     
 
     #fit Zipf: P(x, b)=a_Z/x^b_Z
-    res_Z = minimize(L_Zipf, b_0, Y)
+    res_Z = ZipfFitter(T[0], T[1]).fit_Zipf(b_0)
     
     #calculate significant figures
     # the fomat string is #.?g, where ? = significant figures
@@ -792,6 +949,42 @@ def FRD_plot(name, block, compo, x_pos = 2, y_pos = 10, FORMAT = 'png', Path = '
         plt.show()
     return FRD_block
 
+def FRD_batch(blocks, n_jobs = 1):
+    '''fit the FRD of many Books at once (no figure), see Curve_Fitting_MLE.py > Zipf_batch()
+    
+    ---Input
+        blocks: list of pandas.DataFrame
+            the block of info() for every Book
+    
+    ---Parameters
+        n_jobs: int, default = 1
+            number of worker processes
+    
+    ---Return
+        FRD_list: list of dict
+            FRD_list[i] has the same format as FRD_block = FRD_plot() of blocks[i],
+            so it can be saved in parameter/ by IO_stat.py > save_parameters()
+    '''
+    tables = [(block['blockRank'].to_numpy(), block['blockFreq'].to_numpy()) for block in blocks]
+    rows = Zipf_batch(tables, n_jobs)
+    
+    FRD_list = []
+    for (rank, freq), (a, b, neg_L, jac) in zip(tables, rows):
+        #significant figures, the same as FRD_plot()
+        dig_rho = len(str(int(max(freq))))
+        b_Z = format(b, '#.%dg' % dig_rho)
+        t_Z = (int(min(rank)), int(max(rank)), float(b_Z))
+        a_Z = format(float(1 / incomplete_harmonic(t_Z)), '#.%dg' % dig_rho)
+        
+        FRD_block = {}
+        FRD_block['ab'] = (a_Z, b_Z)
+        FRD_block['b_jac'] = float(jac)
+        FRD_block['neg_L'] = format(float(neg_L), '#.%dg' % dig_rho)
+        FRD_block['length'] = int(sum(freq))
+        FRD_block['V_1'] = int(max(rank))
+        FRD_list.append(FRD_block)
+    return FRD_list
+
 def draw_density_plot(cooridnate_x, cooridnate_y, slice_number):
     """Input cooridnate of datapoints
        draw a density diagram and slice it into slice_number pieces. 
@@ -803,9 +996,11 @@ def draw_density_plot(cooridnate_x, cooridnate_y, slice_number):
     
 def read_file_generate_fake_constraint(constraint = 5, compo_num = 2, out_file =  'fake1.txt', sample_block_num = 8000,
                             num_block_in_fake_scrip = 15000, 
-                            alpha = 1.00001, noun = False):
+                            alpha = 1.00001, noun = False, generator = ZipfGenerator):
     """Read "roc2.txt" file, and then generate a fake script satisfying Zipfs' law. All the blocks in 
     the output script share the same lenth compo_num
+    
+    generator: ZipfGenerator or RejectionInversionZipfGenerator (no CDF stored, for very large sample_block_num)
     """
     CONSTRAINT = constraint
     SAMPLE_block_NUM = sample_block_num
@@ -815,7 +1010,7 @@ def read_file_generate_fake_constraint(constraint = 5, compo_num = 2, out_file =
     NOUN = noun
     compo_NUM = compo_num
     
-    zipf_gen =  ZipfGenerator(SAMPLE_block_NUM,ALPHA)
+    zipf_gen =  generator(SAMPLE_block_NUM,ALPHA)
     f =  open("roc2.txt","r")
 
     world_list = []
@@ -831,37 +1026,12 @@ def read_file_generate_fake_constraint(constraint = 5, compo_num = 2, out_file =
 
     f.close()
     
-    for item in world_list:
-        if item == " ":
-            world_list.remove(item)
+    world_list = [item for item in world_list if item != " "]
     #######################################
     ##########produce fake blocks###########
+    #vectorized, see fake.py > constraint_blocks(), the seed comes from the global random module
     
-    tmp_list = []
-    for item in world_list:
-        for e in list(item):
-            if e not in tmp_list:
-                tmp_list.append(e)
-    compo_count_dic = {}
-    for c in tmp_list:
-        compo_count_dic[c] = 0
-    
-
-        
-    
-    list_2 = []
-    tmp = ''
-    for i in range(SAMPLE_block_NUM):
-        for j in range(compo_num):
-            c = random.choice(tmp_list)
-            compo_count_dic[c] += 1
-            if compo_count_dic[c] >= CONSTRAINT:
-                tmp_list.remove(c)
-            tmp = tmp + c
-        list_2.append(tmp)
-        tmp = ''
-    
-    world_list = list_2[:]
+    world_list = list(constraint_blocks(world_list, compo_num, SAMPLE_block_NUM, CONSTRAINT, random.getrandbits(64)))
 
     print("blocks in corpus: " ,len(world_list))
     
@@ -898,9 +1068,11 @@ def read_file_generate_fake_constraint(constraint = 5, compo_num = 2, out_file =
 
 def read_file_generate_fake(compo_num = 2, out_file =  'fake1.txt', sample_block_num = 8000,
                             num_block_in_fake_scrip = 15000, 
-                            alpha = 1.00001, noun = False):
+                            alpha = 1.00001, noun = False, generator = ZipfGenerator):
     """Read "roc2.txt" file, and then generate a fake script satisfying Zipfs' law. All the blocks in 
     the output script share the same lenth compo_num
+    
+    generator: ZipfGenerator or RejectionInversionZipfGenerator (no CDF stored, for very large sample_block_num)
     """
     SAMPLE_block_NUM = sample_block_num
     ALPHA = alpha
@@ -909,7 +1081,7 @@ def read_file_generate_fake(compo_num = 2, out_file =  'fake1.txt', sample_block
     NOUN = noun
     compo_NUM = compo_num
     
-    zipf_gen =  ZipfGenerator(SAMPLE_block_NUM,ALPHA)
+    zipf_gen =  generator(SAMPLE_block_NUM,ALPHA)
     f =  open("roc2.txt","r")
 
     world_list = []
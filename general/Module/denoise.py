@@ -20,6 +20,7 @@ import matplotlib.pyplot as plt
 from .count import *
 from .Curve_Fitting_MLE import *
 from scipy.optimize import curve_fit
+from concurrent.futures import ProcessPoolExecutor
 
  
 def choose_point(m, n, V, H, big, longest):
@@ -381,7 +382,58 @@ def coarse_grain(px, py, Range, num_window = 101):
     return x_avg, y_avg
 
 
-def plot_g(L, V, H, big, name, longest, toler = 50, num_window = 101, num_section = 2, delta = 0.15, percent = 0.05):
+def choose_points(L, V, H, big, longest):
+    '''choose_point() for the {1, n} rectangles of g_1 ~ g_L.
+    The result does not depend on the de-noising parameters, 
+    so it can be computed once and shared by denoise_g(), plot_g() and sweep.py
+    
+    ---Return
+        points_set: dict, {n: points}, where points = choose_point(1, n, V, H, big, longest)
+    '''
+    return {n: choose_point(1, n, V, H, big, longest) for n in range(1, L+1)}
+
+def denoise_g(L, V, H, points_set, toler = 50, num_window = 101, num_section = 2, delta = 0.15, percent = 0.05, D_0 = 50, Lambda = 1):
+    '''compute-only part of plot_g(): de-noise and coarse-grain g_1 ~ g_L without drawing.
+    
+    ---Input
+    1. V, H: list or np.array
+        the same as plot_g()
+    
+    2. points_set: dict, {n: points}
+        return of choose_points(L, V, H, big, longest)
+    
+    ---Parameters
+        L, toler, num_window, num_section, delta, percent: see plot_g()
+        D_0, Lambda: see DENOISE()
+    
+    ---Return
+        g, glu: the same as plot_g()
+    '''
+    g = {}
+    glu = {}
+    for n in range(1, L+1):
+        m = 1
+        points = points_set[n]
+        if n == 1:
+            luptx, lupty = sep_point(m, n, points)
+        else:
+            luptx, lupty = DENOISE(m, n, V, H, points, toler, num_section, delta, percent, D_0, Lambda)
+        
+        #----Develope note
+        #I use list instead of array here (luptx and lupty is array)
+        #since literal_eval can only read dictionary like {'g1': [], 'g2': []} 
+        #it cannot read mixing type such as {'g1': [], 'g2': array([])} 
+        #----
+        
+        glu['g' + str(n)] = (list(luptx), list(lupty))
+        
+        #coarse-grain
+        Range = [0.25*V[0], V[0]]
+        x_avg, y_avg = coarse_grain(luptx, lupty, Range, num_window)
+        g['g' + str(n)] = (x_avg, y_avg)
+    return g, glu
+
+def plot_g(L, V, H, big, name, longest, toler = 50, num_window = 101, num_section = 2, delta = 0.15, percent = 0.05, D_0 = 50, Lambda = 1):
     '''
     ---Input
     1. V, H: list or np.array
@@ -424,6 +476,8 @@ def plot_g(L, V, H, big, name, longest, toler = 50, num_window = 101, num_sectio
         affect the tolerance of left_upper()
         see left_upper() > inner functions > local_con for explaination
         
+    7. D_0, Lambda: float, default = 50, 1
+        see DENOISE()
     
     ---Return
         g: set, {g_1, g_2,...,g_L}, where g_k = (x_avg, y_avg) denote the points after coarse-grain
@@ -431,6 +485,9 @@ def plot_g(L, V, H, big, name, longest, toler = 50, num_window = 101, num_sectio
 
         ps. lu means left upper
     '''
+    points_set = choose_points(L, V, H, big, longest)
+    g, glu = denoise_g(L, V, H, points_set, toler, num_window, num_section, delta, percent, D_0, Lambda)
+    
     #-----------------------------plot horizontal and vertical lines
     Slice_number = 50 #this value decide the number of points on horizontal and vertical lines
     number_of_lines = 4
@@ -443,33 +500,13 @@ def plot_g(L, V, H, big, name, longest, toler = 50, num_window = 101, num_sectio
         plt.plot(x_range, y_const) #plot y=H[i]
         plt.plot(x_const, y_range) #plot x=V[i]   
     #-----------------------------   
-    g = {}
-    glu = {}
     #plt.locator_params(axis='y', nbins=5)
     #pick up points on scaling line
     for n in range(1, L+1):
-        (m, n) = (1, n)
-        points = choose_point(m, n, V, H, big, longest)
-        px, py = sep_point(m, n, points)
+        px, py = sep_point(1, n, points_set[n])
         plt.plot(px, py,'o', markersize = '4')
-        if n == 1:
-            luptx, lupty = px, py
-        else:
-            luptx, lupty = DENOISE(m, n, V, H, points, toler, num_section, delta, percent)
-        
-        #----Develope note
-        #I use list instead of array here (luptx and lupty is array)
-        #since literal_eval can only read dictionary like {'g1': [], 'g2': []} 
-        #it cannot read mixing type such as {'g1': [], 'g2': array([])} 
-        #----
-        
-        glu['g' + str(n)] = (list(luptx), list(lupty))
+        luptx, lupty = glu['g' + str(n)]
         plt.plot(luptx, lupty,'.' ,markersize = '4', color = '#e9bf53')
-        
-        #coarse-grain
-        Range = [0.25*V[0], V[0]]
-        x_avg, y_avg = coarse_grain(luptx, lupty, Range, num_window)
-        g['g' + str(n)] = (x_avg, y_avg)
     plt.xlim([0, V[0]*1.03])
     plt.ylim([0, H[0]*1.03])
     plt.xlabel('block', size = 15)
@@ -478,8 +515,150 @@ def plot_g(L, V, H, big, name, longest, toler = 50, num_window = 101, num_sectio
     plt.show()
     return g, glu
 
+def rg_stat(g):
+    '''compute-only part of rg(): ratios g_(k+1)/g_k, r_g, S, C and SC value without drawing.
+    
+    ---Input
+        g: set, output of plot_g() or denoise_g(), see rg()
+    
+    ---Return
+        stat: dict
+            stat['x'], stat['y']: {'g(k+1)/gk': list}, x position and g_(k+1)/g_k of every window
+            stat['STD']: {'g(k+1)/gk': float}, std of g_(k+1)/g_k
+            stat['C']: {'g(k+1)/gk': float}, fraction of windows which are not nan (g2/g1 excluded)
+            stat['R'], stat['ERROR'], stat['S'], stat['C_value'], stat['SC']: float
+            stat['R_dist']: {'g(k+1)/gk': list}, g_(k+1)/g_k for every x without nan
+    '''
+    #stack g_1 ~ g_L into (L * num_window) arrays, padded with nan
+    keys = ['g' + str(k) for k in range(1, len(g) + 1)]
+    num_window = max([len(g[i][0]) for i in g])
+    Gx = np.full((len(keys), num_window), np.nan)
+    Gy = np.full((len(keys), num_window), np.nan)
+    for k, gk in enumerate(keys):
+        Gx[k, :len(g[gk][0])] = g[gk][0]
+        Gy[k, :len(g[gk][1])] = g[gk][1]
+    
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        ratio = Gy[1:] / Gy[:-1] #ratio[k-1] = g_(k+1)/g_k
+    mid = 0.5*Gx[1:] + 0.5*Gx[:-1]
+    valid = ~np.isnan(ratio)
+    weight = valid.sum(axis = 1) #number of data of g_(k+1)/g_k
+    ratio_0 = np.where(valid, ratio, 0)
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        mean = ratio_0.sum(axis = 1) / weight
+        std = np.sqrt((np.where(valid, ratio - mean[:, None], 0)**2).sum(axis = 1) / weight)
+    STD_k = np.round(std, 3) #STD of g_(k+1)/g_k
+    r_k = np.round(mean, 3) #average ratio of g_(k+1)/g_k
+    
+    names = [keys[k+1] + '/' + keys[k] for k in range(len(keys) - 1)]
+    x = {i: list(mid[k]) for k, i in enumerate(names)}
+    y = {i: list(ratio[k]) for k, i in enumerate(names)}
+    STD = {i: STD_k[k] for k, i in enumerate(names)}
+    R_dist = {i: list(ratio[k][valid[k]]) for k, i in enumerate(names)} #record g_(k+1)/g_k for every x withour NAN
+    
+    #calculate SC value excluding g2/g1
+    w, r, e = weight[1:], r_k[1:], STD_k[1:]
+    tot = w.sum()
+    R = np.sum(w*r/tot)
+    ERROR = np.sum(w*e**2/tot)**0.5 #error propagation
+    C = {i: weight[k]/num_window for k, i in enumerate(names) if k > 0}
+    C_value = np.mean(weight[1:]/num_window)
+    S_value = 1 - ERROR/R
+    
+    stat = {'x': x, 'y': y, 'STD': STD, 'C': C, 'R': R, 'ERROR': ERROR, 'S': S_value, 'C_value': C_value,
+            'SC': S_value * C_value, 'R_dist': R_dist}
+    return stat
+
+def rg_value(g):
+    '''compute-only rg(), return Rg = (R, ERROR, R_dist, SC_value) without drawing
+    '''
+    stat = rg_stat(g)
+    return (format(stat['R'], '.3f'), format(stat['ERROR'], '.3f'), stat['R_dist'], format(stat['SC'], '.3f'))
+
+#shared input of every replicate of rg_bootstrap(), filled by init_bootstrap() once per worker process
+shared_boot = {}
+
+def init_bootstrap(block, compo, L, para):
+    '''store the shared input in each worker process, so that block and compo are sent once per worker instead of once per replicate
+    '''
+    shared_boot['block'] = block
+    shared_boot['compo'] = compo
+    shared_boot['L'] = L
+    shared_boot['para'] = para
+
+def bootstrap_trial(seed):
+    '''one bootstrap replicate of rg_bootstrap(): resample -> {V}, {H} -> envelope -> r_g, S, C, SC
+    if a step fails on a degenerate resample, every value is nan
+    '''
+    block, compo, L, para = shared_boot['block'], shared_boot['compo'], shared_boot['L'], shared_boot['para']
+    try:
+        big_b, compo_b, block_b, longest_b = resample_info(block, compo, seed)
+        V, H = geometric_sequence(block_b, compo_b)
+        points_set = choose_points(L, V, H, big_b, longest_b)
+        g, glu = denoise_g(L, V, H, points_set, **para)
+        stat = rg_stat(g)
+    except (ValueError, ZeroDivisionError, IndexError) as e:
+        print('replicate failed: %s' % e)
+        return dict.fromkeys(['R', 'ERROR', 'S', 'C', 'SC'], np.nan)
+    return {'R': stat['R'], 'ERROR': stat['ERROR'], 'S': stat['S'], 'C': stat['C_value'], 'SC': stat['SC']}
+
+def rg_bootstrap(block, compo, L, n_boot = 100, seed = None, ci = 95, n_jobs = 1, **para):
+    '''confidence intervals of r_g, S, C and SC by bootstrap.
+    Each replicate resamples the blocks multinomially from the FRD (count.py > resample_info())
+    and re-runs the envelope pipeline without drawing.
+    
+    ---Input
+        block, compo: pandas.DataFrame
+            the return of info()
+    
+    ---Parameters
+    1. L: int
+        number of scaling line, see plot_g()
+    
+    2. n_boot: int, default = 100
+        number of replicates
+    
+    3. seed: int, default = None
+        every replicate gets an independent stream spawned from np.random.SeedSequence(seed),
+        so the result is reproducible and does not depend on n_jobs
+    
+    4. ci: float, default = 95
+        confidence level (%)
+    
+    5. n_jobs: int, default = 1
+        number of worker processes
+    
+    6. para: toler, num_window, num_section, delta, percent, D_0, Lambda
+        see denoise_g()
+    
+    ---Return
+    1. CI: dict, {'R': (low, high), 'S': ..., 'C': ..., 'SC': ...}
+        percentile confidence intervals
+    
+    2. samples: pandas.DataFrame
+        R, ERROR, S, C, SC of every replicate, nan if the replicate failed
+    
+    3. n_failed: int
+        number of failed replicates, they are left out of CI
+    '''
+    seeds = np.random.SeedSequence(seed).spawn(n_boot)
+    initargs = (block, compo, L, para)
+    if n_jobs > 1:
+        with ProcessPoolExecutor(n_jobs, initializer = init_bootstrap, initargs = initargs) as executor:
+            rows = list(executor.map(bootstrap_trial, seeds))
+    else:
+        init_bootstrap(*initargs)
+        rows = [bootstrap_trial(sd) for sd in seeds]
+    
+    samples = pd.DataFrame(rows)
+    q = [(100 - ci)/2, 100 - (100 - ci)/2]
+    CI = {k: tuple(np.nanpercentile(samples[k], q)) for k in ['R', 'S', 'C', 'SC']}
+    n_failed = int(samples.isna().all(axis = 1).sum())
+    return CI, samples, n_failed
+
 def rg(name, g, FORMAT, Path = ''):
     '''plot r_g of your data
+    The computation is done by rg_stat()
     
     ---Input
         g: set 
@@ -518,40 +697,11 @@ def rg(name, g, FORMAT, Path = ''):
             Rg[2] can conut the distribution of r_g (for future researches, such as error distribution),
             Rg[3] is SC value
     '''
-    num_window = max([len(g[i][0]) for i in g])
-    len_g = len(g)
-    y = {}
-    x = {}
-    STD = {} #STD of g_n/g_(n+1)
-    weight = {} #number of data of g_n/g_(n+1)
-    r = {} #average ratio of g_n/g_(n+1)
-    R_dist = {} #record g_(k+1)/g_k for every x withour NAN
-    for k in range(1, len_g):
-        gk1 = 'g' + str(k+1)
-        gk = 'g' + str(k)
-        y[gk1 + '/' + gk] = [g[gk1][1][j]/g[gk][1][j] for j in range(num_window)]
-        x[gk1 + '/' + gk] = [0.5*g[gk1][0][j] + 0.5*g[gk][0][j] for j in range(num_window)]
-        
-        y_k = [i for i in y[gk1 + '/' + gk] if i == i] # this is y without NAN
-        R_dist[gk1 + '/' + gk] = y_k
-        STD[gk1 + '/' + gk] = round(np.std(y_k), 3)
-        weight[gk1 + '/' + gk] = len(y_k)
-        r[gk1 + '/' + gk] = round(np.mean(y_k), 3)
+    stat = rg_stat(g)
+    x, y, STD, C = stat['x'], stat['y'], stat['STD'], stat['C']
+    S_value, C_value = stat['S'], stat['C_value']
     
     fig, ax = plt.subplots()
-    #calculate SC value excluding g2/g1
-    error = {}
-    for i in STD:
-        if i != 'g2/g1':
-            error[i] = STD[i]
-    del weight['g2/g1'], r['g2/g1']
-    tot = sum([weight[w] for w in weight])
-    R = sum([weight[i]*r[i]/tot for i in weight])
-    ERROR = (sum([weight[i]*error[i]**2/tot for i in weight]))**0.5 #error propagation
-    EE = (sum([weight[i]*error[i]/tot for i in weight]))
-    
-    
-    C = {}
     marker_list = ['o', 'X', 'D', '^', '<', '>', '1', '2', '3', '4']
     marker_index = 0
     
@@ -560,7 +710,6 @@ def rg(name, g, FORMAT, Path = ''):
         py = y[i]
         std = STD[i]
         if i != 'g2/g1':
-            C[i] = weight[i]/len(py)
             if C[i] < 0.8:
                 print('C < 0.8: %s, %f' % (i, C[i]))
         ax.errorbar(px, py, yerr = std) #plot errorbar
@@ -568,15 +717,12 @@ def rg(name, g, FORMAT, Path = ''):
         marker_index += 1
         plt.legend(loc = 'lower left', prop = {'size': 15})
     
-    C_value = np.mean([C[i] for i in C])
-    S_value = 1 - ERROR/R
-    
     #record significant figures
-    R = format(R, '.3f')
-    ERROR = format(ERROR, '.3f')
-    SC_value = format(S_value * C_value, '.3f')
+    R = format(stat['R'], '.3f')
+    ERROR = format(stat['ERROR'], '.3f')
+    SC_value = format(stat['SC'], '.3f')
     
-    Rg = (R, ERROR, R_dist, SC_value)
+    Rg = (R, ERROR, stat['R_dist'], SC_value)
     
     
     xmin, xmax = plt.xlim([0,None])
@@ -616,7 +762,174 @@ def rg(name, g, FORMAT, Path = ''):
         plt.show()
     return Rg
 
-def scaling_fit(data, Rg_0, V, H, Zipf, name, FORMAT = 'pdf', Path = ''):
+def fun_theory(x, A, C, Rg_0, b):
+    '''theory of scaling curve, g(x) = A * Rg_0^(C * x^-b)
+    See Sec. VIII in SI for details.
+    '''
+    return A * Rg_0**(C * (x**-b))
+
+def jac_theory(x, A, C, Rg_0, b):
+    '''analytic Jacobian of fun_theory() with respect to (A, C), shape = (len(x), 2)
+    dg/dA = Rg_0^(C * x^-b)
+    dg/dC = A * Rg_0^(C * x^-b) * ln(Rg_0) * x^-b
+    '''
+    xb = x**-b
+    dA = Rg_0**(C * xb)
+    return np.column_stack((dA, A * dA * np.log(Rg_0) * xb))
+
+def fit_basis(x, y, q0, Rg_0, b):
+    '''fit one scaling line with fun_theory() and its analytic Jacobian.
+    This function is defined at module level so that it can be sent to a worker process.
+    
+    ---Return
+        popt, pcov: return of curve_fit()
+    '''
+    def fun(x, A, C):
+        return fun_theory(x, A, C, Rg_0, b)
+    def jac(x, A, C):
+        return jac_theory(x, A, C, Rg_0, b)
+    return curve_fit(fun, x, y, q0, jac = jac, bounds = (0, [np.inf, np.inf]))
+
+def pad_lines(data, keys):
+    '''stack scaling lines of different lengths into (len(keys) * max_points) arrays, padded with nan
+    
+    ---Return
+        X, Y: 2D array, X[i] and Y[i] are the x and y of data[keys[i]]
+    '''
+    num_points = max([len(data[gk][0]) for gk in keys])
+    X = np.full((len(keys), num_points), np.nan)
+    Y = np.full((len(keys), num_points), np.nan)
+    for i, gk in enumerate(keys):
+        X[i, :len(data[gk][0])] = data[gk][0]
+        Y[i, :len(data[gk][1])] = data[gk][1]
+    return X, Y
+
+def fit_scaling_lines(data, Rg_0, Zipf, q0 = (100, 0.5), executor = None):
+    '''compute-only part of scaling_fit(): fit every candidate basis g_k (k >= 2) and find the best one.
+    No figure is drawn, so this function can be called many times (e.g. by fit_with_cut()).
+    
+    ---Input
+    1. data: set, {'g1': array([[x...], [y...]]), 'g2': ..., ...}
+        points on scaling lines, see scaling_fit()
+    
+    2. Rg_0, Zipf: 
+        the same as scaling_fit()
+    
+    ---Parameters
+    1. q0: tuple (A, C) or dict {gk: (A, C)}, default = (100, 0.5)
+        initial guess of curve_fit(). 
+        If q0 is a dict, the basis gk which appears in q0 will be warm-started from q0[gk],
+        others use (100, 0.5)
+    
+    2. executor: concurrent.futures.Executor, default = None
+        if None, fit candidates one by one; 
+        else, the candidate fits are dispatched to executor (e.g. ProcessPoolExecutor)
+    
+    ---Return
+    1. fit_para: dict, {gk: (popt, pcov)}
+        return of curve_fit() for every basis gk
+    
+    2. tot_Dev: dict, {gk: float}
+        total deviation of scaling lines g2 ~ gN when gk is the basis
+    
+    3. best: str
+        the basis which has the smallest tot_Dev
+    
+    ps: RuntimeError of curve_fit() is not caught here
+    '''
+    b = float(Zipf[1])
+    Rg_0 = float(Rg_0)
+    number = len(data) #number of scaling lines need fitting
+    candidates = ['g' + str(k) for k in range(2, number + 1)]
+    
+    def q_init(gk):
+        if isinstance(q0, dict):
+            return q0.get(gk, (100, 0.5))
+        return q0
+    
+    fit_para = {}
+    if executor is None:
+        for gk in candidates:
+            fit_para[gk] = fit_basis(data[gk][0], data[gk][1], q_init(gk), Rg_0, b)
+    else:
+        futures = {gk: executor.submit(fit_basis, data[gk][0], data[gk][1], q_init(gk), Rg_0, b) for gk in candidates}
+        for gk in candidates:
+            fit_para[gk] = futures[gk].result()
+    
+    #deviation of every candidate against every line g2 ~ gN in one broadcast, shape = (basis, line, point)
+    X, Y = pad_lines(data, candidates)
+    popt = np.array([fit_para[gk][0] for gk in candidates]) 
+    k = np.arange(2, number + 1)
+    shift = Rg_0**(k[None, :] - k[:, None]) #ex: k=2, i=4 then theo['g4'] = fun * Rg^2
+    theo = fun_theory(X[None, :, :], popt[:, 0, None, None], popt[:, 1, None, None], Rg_0, b) * shift[:, :, None]
+    Dev = np.nansum(np.square(theo - Y[None, :, :]), axis = (1, 2))
+    tot_Dev = {gk: Dev[i] for i, gk in enumerate(candidates)}
+        
+    best = min(tot_Dev, key = tot_Dev.get) #Get the key corresponding to the minimum value within a dictionary
+    return fit_para, tot_Dev, best
+
+def fitting_score(data, V):
+    '''fitting score, based on an empirical truth that good fitting use less data
+    The use of fitting score will be disscussed in the future research
+    See Sec. X in SI for detals
+    '''
+    dx_min = {i : min(data[i][0]) for i in data} #find minima x in data
+    if (V[0] - dx_min[min(dx_min)]) < 0.75*V[0]:
+        score = 1
+    elif V[0] > (V[0] - dx_min[min(dx_min)]) >= 0.75*V[0]:
+        score = (0.75*V[0])/(V[0] - dx_min[min(dx_min)])
+    else:
+        score = 0.5
+    return score
+
+def draw_scaling_fit(data, Rg_0, V, H, Zipf, popt, best, name, FORMAT = 'pdf', Path = ''):
+    '''draw scaling lines and their fitting curves. 
+    data, Rg_0, V, H, Zipf, name, FORMAT, Path are the same as scaling_fit()
+    popt and best come from fit_scaling_lines(), i.e. popt = fit_para[best][0]
+    '''
+    fig, ax = plt.subplots()
+    #plt.locator_params(axis='y', nbins=5)
+    #-----------------------------plot horizontal and vertical lines
+    Slice_number = 50 #this value decide the number of points on horizontal and vertical lines
+    number_of_lines = 4
+    x_range = np.linspace(0, max(V), Slice_number)
+    y_range = np.linspace(0, max(H), Slice_number)
+        
+        
+    for i in range(number_of_lines):
+        x_const = [V[i] for j in range(Slice_number)] #x_const =[V[i], V[i], ..., V[i]], Slice_number elements
+        y_const = [H[i] for j in range(Slice_number)] #y_const =[H[i], H[i], ..., H[i]], Slice_number elements
+        plt.plot(x_range, y_const) #plot y=H[i]
+        plt.plot(x_const, y_range) #plot x=V[i]   
+    
+    b = float(Zipf[1])
+    Rg_0 = float(Rg_0)
+    k_best = int(best.split('g')[1]) #ex: best = 'g2' then k_best = 2
+    for i in range(1, len(data) + 1):
+        Gi = 'g' + str(i)
+        #ex: k_best=2, i=1 then theo['g1] = Rg^(-1)* fun
+        theo = fun_theory(data[Gi][0], *popt, Rg_0, b) * Rg_0**(i - k_best) 
+        plt.plot(data[Gi][0], data[Gi][1], '.', markersize = '4', color ='#e9bf53')
+        plt.plot(data[Gi][0], theo, 'o', markersize = '4')
+    xm, xM = plt.xlim([0,V[0]*1.03])
+    ym, yM = plt.ylim([0,H[0]*1.03])
+    
+    plt.xlabel('block', size = 15)
+    plt.ylabel('component', size = 15)  
+    plt.title(name, size = 20)
+
+    try:
+        if Path == '':
+            fig.savefig('fitting ' + name + '.' + FORMAT, dpi = 300, format = FORMAT)
+            plt.show()
+        else:
+            fig.savefig(Path + 'fitting ' + name + '.' + FORMAT, dpi = 300, format = FORMAT)
+            plt.close()
+    except (OSError, IOError, ValueError) as e:
+        print(f"Warning: Could not save figure - {e}")
+        plt.show()
+
+def scaling_fit(data, Rg_0, V, H, Zipf, name, FORMAT = 'pdf', Path = '', n_jobs = 1):
     '''find out best fitting curve for scaling lines
     use fun to be fitting model, select g1~gN to be basis of scaling function, after that find out the best basis and parameters
     by check deviation of different basis. See Sec. VIII in SI for details. 
@@ -629,6 +942,8 @@ def scaling_fit(data, Rg_0, V, H, Zipf, name, FORMAT = 'pdf', Path = ''):
     3. check all possible and resonable basis, findout the smallest tot_Dev['gk'] 
     4. calculate fitting score, base on an empirical truth that good fitting use less data
     
+    The computation is done by fit_scaling_lines(), the figure is drawn by draw_scaling_fit().
+    
     ---Input
     1. data: set, the output that comes form plot_g(). It can be g or glu
         It is the set of points on scaling lines 
@@ -657,6 +972,10 @@ def scaling_fit(data, Rg_0, V, H, Zipf, name, FORMAT = 'pdf', Path = ''):
         if Path == np.nan, no figure will be saved (just show it)
         else, the figure will be saved according to Path
     
+    3. n_jobs: int, default = 1
+        number of worker processes used to fit the candidate basis g_k.
+        n_jobs = 1 fits them one by one. It pays off when you fit 10+ scaling lines.
+    
     ---Output
         a picture with best fitting curve
     
@@ -667,7 +986,7 @@ def scaling_fit(data, Rg_0, V, H, Zipf, name, FORMAT = 'pdf', Path = ''):
                     fitting parameters of scaling function for the best basis
                     popt (parameters optimization) contains q and C of fun_theory(x, q, C)
                     pcov (parameters covariance) contains the covariance
-                    see innner function > fun_theory()
+                    see fun_theory()
 
                     for curve_fit(),
                     see scipy.optimize.curve_fit for data structure
@@ -677,103 +996,16 @@ def scaling_fit(data, Rg_0, V, H, Zipf, name, FORMAT = 'pdf', Path = ''):
                     see Sec. X in SI for detals
     
     '''
-    fig, ax = plt.subplots()
-    #plt.locator_params(axis='y', nbins=5)
-    #-----------------------------plot horizontal and vertical lines
-    Slice_number = 50 #this value decide the number of points on horizontal and vertical lines
-    number_of_lines = 4
-    x_range = np.linspace(0, max(V), Slice_number)
-    y_range = np.linspace(0, max(H), Slice_number)
-        
-        
-    for i in range(number_of_lines):
-        x_const = [V[i] for j in range(Slice_number)] #x_const =[V[i], V[i], ..., V[i]], Slice_number elements
-        y_const = [H[i] for j in range(Slice_number)] #y_const =[H[i], H[i], ..., H[i]], Slice_number elements
-        plt.plot(x_range, y_const) #plot y=H[i]
-        plt.plot(x_const, y_range) #plot x=V[i]   
-    
-    #---innner function
-    b = float(Zipf[1])
-    Rg_0 = float(Rg_0)
-    def fun_theory(x, A, C):
-        '''theory of scaling curve                
-        '''
-        return A * Rg_0**(C * (x**-b))
-    #------------------
-    
-    number = len(data) #number of scaling lines need fitting
-    q0 = (100, 0.5) #initial guess
-    fit_para = {}
-    tot_Dev = {}
-    
     #change data[gk] = [[x...], [y...]] to array([[x...], [y...]]) so that fun_theory(data[gk]) can work
-    for gk in data:
-        data[gk] = np.array(data[gk])
-    
-    for gk in data:
-        if gk != 'g1':           
-            theo = {}
-            Dev = {}
-            #popt is the optimal values for the parameters (q, s, t)
-            popt, pcov = curve_fit(fun_theory, data[gk][0], data[gk][1], q0, bounds = (0, [np.inf, np.inf]))
-            fit_para[gk] = (popt, pcov)   
-            k = int(gk.split('g')[1]) #ex: gk = 'g2' then k = 2
-            for i in range(2, number + 1):
-                Gi = 'g' + str(i)
-                theo[Gi] = fun_theory(data[Gi][0], *popt) * Rg_0**(i - k) #ex: k=2, i=4 then theo['g3'] = fun * Rg^2
-                diff = theo[Gi] - data[Gi][1]
-                Dev[Gi] = np.sum(np.square(diff))
-            tot_Dev[gk] = np.sum([Dev[j] for j in Dev])
-        
-    best = min(tot_Dev, key = tot_Dev.get) #Get the key corresponding to the minimum value within a dictionary
-    k_best = int(best.split('g')[1]) #ex: best = 'g2' then k_best = 2
+    data = {gk: np.array(data[gk], dtype = float) for gk in data}
     
-    for i in range(1, number + 1):
-        Gi = 'g' + str(i)
-        #ex: k_best=2, i=1 then theo['g1] = Rg^(-1)* fun
-        theo[Gi] = fun_theory(data[Gi][0], *fit_para[best][0]) * Rg_0**(i - k_best) 
-        plt.plot(data[Gi][0], data[Gi][1], '.', markersize = '4', color ='#e9bf53')
-        plt.plot(data[Gi][0], theo[Gi], 'o', markersize = '4')
-    xm, xM = plt.xlim([0,V[0]*1.03])
-    ym, yM = plt.ylim([0,H[0]*1.03])
-    
-    #-------------------------------------
-    '''
-    A = format(popt[0], '#.4g')  # give 4 significant digits
-    if A[-1] == '.':
-        A = A[:-1]
-    B = format(popt[1], '#.4g')  # give 4 significant digits
-    if B[-1] == '.':
-        B = B[:-1]
-    #plt.text(0.05*xM, 0.05*yM, r'$f_%d=%s \times %.3f^{%s x^{-%.2f}}$' % (n, A, Rf, B, popt[2]), fontsize=24, color ='black')
-    '''
-    #-------------------------------------
-    
-    
-    plt.xlabel('block', size = 15)
-    plt.ylabel('component', size = 15)  
-    plt.title(name, size = 20)
-    
-    #the following part is used to calculate fitting score, based on an empirical truth that good fitting use less data
-    #The use of fitting score will be disscussed in the future research
-    dx_min = {i : min(data[i][0]) for i in data} #find minima x in data
-    if (V[0] - dx_min[min(dx_min)]) < 0.75*V[0]:
-        score = 1
-    elif V[0] > (V[0] - dx_min[min(dx_min)]) >= 0.75*V[0]:
-        score = (0.75*V[0])/(V[0] - dx_min[min(dx_min)])
+    if n_jobs > 1:
+        with ProcessPoolExecutor(n_jobs) as executor:
+            fit_para, tot_Dev, best = fit_scaling_lines(data, Rg_0, Zipf, executor = executor)
     else:
-        score = 0.5
-
-    try:
-        if Path == '':
-            fig.savefig('fitting ' + name + '.' + FORMAT, dpi = 300, format = FORMAT)
-            plt.show()
-        else:
-            fig.savefig(Path + 'fitting ' + name + '.' + FORMAT, dpi = 300, format = FORMAT)
-            plt.close()
-    except (OSError, IOError, ValueError) as e:
-        print(f"Warning: Could not save figure - {e}")
-        plt.show()
+        fit_para, tot_Dev, best = fit_scaling_lines(data, Rg_0, Zipf)
+    score = fitting_score(data, V)
+    draw_scaling_fit(data, Rg_0, V, H, Zipf, fit_para[best][0], best, name, FORMAT, Path)
         
     fit_para_best = {}
     fit_para_best['popt'] = list(fit_para[best][0])
@@ -782,11 +1014,78 @@ def scaling_fit(data, Rg_0, V, H, Zipf, name, FORMAT = 'pdf', Path = ''):
 
     return fit_para_best
 
-def fit_with_cut(data, Rg_0, V, H, Zipf, name, FORMAT, Path = ''):
+def cut_data(data, lower):
+    '''keep the points whose x >= lower on every scaling line (boolean mask, no python loop over points)
+    
+    ---Input
+        data: set, {gk: array([[x...], [y...]])}
+        lower: float, low bound of x
+    
+    ---Return
+        D: set, {gk: array([[x...], [y...]])} after cutting
+    '''
+    return {gk: data[gk][:, data[gk][0] >= lower] for gk in data}
+
+def search_cut(data, Rg_0, V, Zipf, search = 'linear', executor = None):
+    '''compute-only part of fit_with_cut(): find the largest cut (low bound = cut*V[0]) which can be fitted.
+    
+    ---Input
+        data, Rg_0, V, Zipf: the same as fit_with_cut()
+    
+    ---Parameters
+    1. search: 'linear' or 'bisect', default = 'linear'
+        see fit_with_cut(). Only 'bisect' warm-starts a fit from the last fitted cut, 'linear' ends at its first fitted cut.
+    
+    2. executor: concurrent.futures.Executor, default = None
+        see fit_scaling_lines()
+    
+    ---Return
+        (cut, D, fit_para, tot_Dev, best), where D is data after cutting and the others come from fit_scaling_lines()
+        if no cut can be fitted, return None
+    '''
+    data = {gk: np.array(data[gk], dtype = float) for gk in data}
+    data_range = [0.25 - i*0.01 for i in range(26)]
+    warm = {} #popt of the last fitted cut, {gk: (A, C)}, used by the later attempts of 'bisect'
+    result = {} #{index of data_range: (cut, D, fit_para, tot_Dev, best)}
+    
+    def attempt(i):
+        D = cut_data(data, data_range[i]*V[0])
+        try:
+            fit_para, tot_Dev, best = fit_scaling_lines(D, Rg_0, Zipf, warm, executor)
+        except RuntimeError:
+            return False
+        for gk in fit_para:
+            warm[gk] = fit_para[gk][0]
+        result[i] = (data_range[i], D, fit_para, tot_Dev, best)
+        return True
+    
+    if search == 'linear':
+        for i in range(len(data_range)):
+            if attempt(i):
+                break
+    else:
+        #fail at lo (or lo = -1), succeed at hi
+        lo, hi = -1, len(data_range) - 1
+        if attempt(hi):
+            while hi - lo > 1:
+                mid = (lo + hi) // 2
+                if attempt(mid):
+                    hi = mid
+                else:
+                    lo = mid
+    
+    if result == {}:
+        return None
+    return result[min(result)]
+
+def fit_with_cut(data, Rg_0, V, H, Zipf, name, FORMAT, Path = '', search = 'linear', n_jobs = 1):
     '''fit data bigger than 0.25*V[0] to rise accuracy of fitting
     if 0.25*V[0] is not small enough, lowering the low bound of data automatically.
     See Sec. VII-B.
     
+    The search over cuts is compute-only (search_cut()), 
+    the figure is drawn only once for the chosen cut.
+    
     ---Input
     1. data: set, the output that comes form plot_g(). It can be g or glu
         It is the set of points on scaling lines 
@@ -815,37 +1114,43 @@ def fit_with_cut(data, Rg_0, V, H, Zipf, name, FORMAT, Path = ''):
         if Path == np.nan, no figure will be saved (just show it)
         else, the figure will be saved according to Path
     
+    3. search: 'linear' or 'bisect', default = 'linear'
+        'linear': try cut = 0.25, 0.24, ..., 0.00 in order and stop at the first cut which can be fitted
+        'bisect': bracket the largest cut which can be fitted by bisection (about 5 fits instead of <= 26).
+                  It assumes that once a cut can be fitted, all the smaller cuts (more data) can also be fitted.
+        In 'bisect', fits are warm-started from the parameters of the last fitted cut.
+        'linear' stops at its first successful fit, so all its fits start from (100, 0.5).
+    
+    4. n_jobs: int, default = 1
+        number of worker processes used to fit the candidate basis g_k, see scaling_fit()
+    
     ---Output
         an fitted plot that has fitting score
     
     ---Return
-        fit_para[best]: return of curve_fit()
-            fitting parameters of scaling function for the best basis
-            fit_para[best][0] contains q and C of fun_theory(x, q, C)
-            see innner function > fun_theory()
-            
-            for curve_fit(),
-            see scipy.optimize.curve_fit for data structure
-            #url = https://docs.scipy.org/doc/scipy/reference/generated/scipy.optimize.curve_fit.html
+        fit_para_best: dict, {'popt', 'pcov', 'score'}
+            the same as scaling_fit()
+            if no cut can be fitted, return None
     '''
-    data_range = [0.25 - i*0.01 for i in range(26)]
-    check = 0
-    for dr in data_range:
-        try:
-            D = {}
-            for gn in data:
-                b = [[],[]]                
-                for i in range(len(data[gn][0])):        
-                    if data[gn][0][i] >= dr*V[0]:
-                        b[0].append(data[gn][0][i])
-                        b[1].append(data[gn][1][i])
-                D[gn] = (b[0], b[1])
-            fit_para = scaling_fit(D, Rg_0, V, H, Zipf, name, FORMAT, Path)
-            print('fitting range = [%d, %d]' % (dr*V[0], V[0]))
-            check = 1
-            return fit_para
-            break
-        except RuntimeError:
-            pass
-    if check == 0 :
-        print('Can not find best parameters in data range.')
\ No newline at end of file
+    if search not in ('linear', 'bisect'):
+        print('search must be "linear" or "bisect"')
+        return None
+    
+    if n_jobs > 1:
+        with ProcessPoolExecutor(n_jobs) as executor:
+            found = search_cut(data, Rg_0, V, Zipf, search, executor)
+    else:
+        found = search_cut(data, Rg_0, V, Zipf, search)
+    if found is None:
+        print('Can not find best parameters in data range.')
+        return None
+    
+    dr, D, fit_para, tot_Dev, best = found
+    print('fitting range = [%d, %d]' % (dr*V[0], V[0]))
+    draw_scaling_fit(D, Rg_0, V, H, Zipf, fit_para[best][0], best, name, FORMAT, Path)
+    
+    fit_para_best = {}
+    fit_para_best['popt'] = list(fit_para[best][0])
+    fit_para_best['pcov'] = [list(a) for a in fit_para[best][1]]
+    fit_para_best['score'] = fitting_score(D, V)
+    return fit_para_best
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+'''
+@author  gmking
+
+This module is used to judge whether the SC value of rg() and the ratios r_H, r_V of which_plot() of a corpus are significant.
+
+ensemble() builds K replicates of a null model of the corpus in memory (no text file is written),
+runs the compute-only pipeline on each of them in worker processes:
+    info_from_counts() -> geometric_sequence() -> geometric_ratio() (r_H, r_V)
+                                               -> choose_points() -> denoise_g() -> rg_stat() (SC)
+and returns the empirical distributions and p-values of the statistics.
+
+Null models:
+    'shuffle': the components of all tokens are shuffled and cut again with the same block lengths (David_Wang_fake.ipynb)
+    'zipf': the frequencies of blocks are redrawn from the Zipf law fitted to the FRD, the block of every rank is kept (Zipf.ipynb)
+    'constraint': blocks of compo_num components are built by fake.py > constraint_draws() with an upper bound on links,
+                  and their frequencies are drawn from the fitted Zipf law (Constraint.ipynb)
+Every replicate gets an independent stream spawned from np.random.SeedSequence(seed).
+'''
+
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from .count import info_from_counts, geometric_sequence, geometric_ratio
+from .denoise import choose_points, denoise_g, rg_stat
+from .fake import constraint_draws
+from .Curve_Fitting_MLE import ZipfFitter
+from .sweep import para_default
+
+stat_list = ['SC', 'Rg', 'r_H', 'r_V']
+
+#shared input of every replicate, filled by init_replicate() once per worker process
+shared = {}
+
+
+def split_blocks(block):
+    '''components of every block as integer codes
+
+    ---Return
+        codes: np.array of int, codes of the components of all blocks, block after block
+        length: np.array of int, number of components of every block
+        names: np.array of str, names[code] = component
+    '''
+    split = [b.split('-') for b in block['block']]
+    length = np.array([len(t) for t in split])
+    codes, names = pd.factorize(np.concatenate(split))
+    return codes, length, np.asarray(names)
+
+def count_rows(rows, names):
+    #rows: (n_token, longest) codes padded with -1 -> {block: frequency}
+    uniq, freq = np.unique(rows, axis = 0, return_counts = True)
+    return {'-'.join(names[r[r >= 0]]): int(f) for r, f in zip(uniq, freq)}
+
+def Zipf_freq(N, V, b, rng):
+    #multinomial frequencies of V ranks drawn from P(r) ~ r^-b
+    p = np.arange(1, V + 1, dtype = float) ** -b
+    return rng.multinomial(N, p / p.sum())
+
+def null_shuffle(block, rng):
+    #shuffle the components of all tokens, cut them with the token lengths of the corpus
+    codes, length, names = split_blocks(block)
+    freq = block['blockFreq'].to_numpy()
+    #every component of a block occurs blockFreq times
+    compo_tokens = np.repeat(codes, np.repeat(freq, length))
+    token_length = np.repeat(length, freq)
+    compo_tokens = rng.permutation(compo_tokens)
+
+    starts = np.cumsum(token_length) - token_length
+    row = np.repeat(np.arange(len(token_length)), token_length)
+    col = np.arange(len(compo_tokens)) - np.repeat(starts, token_length)
+    rows = np.full((len(token_length), length.max()), -1, dtype = np.int64)
+    rows[row, col] = compo_tokens
+    return count_rows(rows, names)
+
+def null_zipf(block, b, rng):
+    #frequencies redrawn from Zipf, the block of every rank is kept
+    freq = block['blockFreq'].to_numpy()
+    new_freq = Zipf_freq(freq.sum(), len(freq), b, rng)
+    keep = new_freq > 0
+    return dict(zip(block['block'][keep], new_freq[keep].tolist()))
+
+def null_constraint(block, compo, b, constraint, compo_num, rng):
+    #blocks of compo_num components with at most constraint links per component, frequencies from Zipf
+    names = compo['compo'].to_numpy()
+    V = len(block)
+    drawn = constraint_draws(len(names), V * compo_num, constraint, rng)
+    new_freq = Zipf_freq(block['blockFreq'].sum(), V, b, rng)
+    #the V drawn rows already carry their frequencies, sum them over identical rows instead of repeating every token
+    uniq, inverse = np.unique(drawn.reshape(V, compo_num), axis = 0, return_inverse = True)
+    freq = np.bincount(inverse.ravel(), weights = new_freq, minlength = len(uniq)).astype(np.int64)
+    return {'-'.join(names[r]): int(f) for r, f in zip(uniq, freq) if f > 0}
+
+def pipeline_stat(big, block, compo, longest, L, para, max_range):
+    '''compute-only statistics of a corpus
+
+    ---Return
+        row: dict, SC and Rg of rg_stat(), r_H and r_V (mean ratios of geometric_ratio())
+            if a step fails, its values are nan
+    '''
+    row = dict.fromkeys(stat_list, np.nan)
+    V, H = geometric_sequence(block, compo)
+    row['r_H'] = geometric_ratio(H, max_range)[1]
+    row['r_V'] = geometric_ratio(V, max_range)[1]
+    try:
+        points_set = choose_points(L, V, H, big, longest)
+        g, glu = denoise_g(L, V, H, points_set, **para)
+        stat = rg_stat(g)
+    except (ValueError, ZeroDivisionError, IndexError) as e:
+        print('SC failed: %s' % e)
+        return row
+    row['SC'], row['Rg'] = stat['SC'], stat['R']
+    return row
+
+def init_replicate(block, compo, null, b, constraint, compo_num, L, para, max_range):
+    '''store the shared input in each worker process, so that block and compo are sent once per worker instead of once per replicate
+    '''
+    shared['block'] = block
+    shared['compo'] = compo
+    shared['null'] = null
+    shared['b'] = b
+    shared['constraint'] = constraint
+    shared['compo_num'] = compo_num
+    shared['L'] = L
+    shared['para'] = para
+    shared['max_range'] = max_range
+
+def run_replicate(seed):
+    #build one replicate of the null model in memory and return its pipeline_stat()
+    rng = np.random.default_rng(seed)
+    block, compo, null = shared['block'], shared['compo'], shared['null']
+    if null == 'shuffle':
+        block_freq = null_shuffle(block, rng)
+    elif null == 'zipf':
+        block_freq = null_zipf(block, shared['b'], rng)
+    else:
+        block_freq = null_constraint(block, compo, shared['b'], shared['constraint'], shared['compo_num'], rng)
+    big_r, compo_r, block_r, longest_r = info_from_counts(block_freq)
+    return pipeline_stat(big_r, block_r, compo_r, longest_r, shared['L'], shared['para'], shared['max_range'])
+
+def ensemble(big, block, compo, longest, null = 'shuffle', K = 100, seed = None, n_jobs = 1, L = 4, max_range = 50,
+             constraint = None, compo_num = None, **para):
+    '''Monte-Carlo null-model ensemble of a corpus
+
+    ---Input
+        big, compo, block, longest: the return of info()
+
+    ---Parameters
+    1. null: 'shuffle', 'zipf' or 'constraint'
+        see the docstring of this module
+
+    2. K: int, number of replicates
+
+    3. seed: int or None
+        every replicate gets a stream spawned from np.random.SeedSequence(seed)
+
+    4. n_jobs: int, number of worker processes
+
+    5. L, max_range: int
+        number of scaling lines of plot_g() and max_range of which_plot()
+
+    6. constraint, compo_num: int
+        only for null = 'constraint', the upper bound of links of a component and the number of components of a block.
+        compo_num = None uses the most frequent block length of the corpus
+
+    7. para: the de-noising parameters of denoise_g(), the missing ones use sweep.py > para_default
+
+    ---Return
+        result: dict
+        (1) result['observed']: dict, SC, Rg, r_H, r_V of the corpus
+        (2) result['samples']: pandas.DataFrame, one row per replicate
+        (3) result['p_value']: dict, {stat: (p_low, p_high)}
+                p_low = (1 + #{null <= observed}) / (1 + K), p_high = (1 + #{null >= observed}) / (1 + K)
+                replicates with nan are not counted
+    '''
+    if null not in ['shuffle', 'zipf', 'constraint']:
+        raise ValueError('null should be shuffle, zipf or constraint, not %s' % null)
+    if null == 'constraint' and constraint is None:
+        raise ValueError('null = constraint needs constraint')
+    for p in para:
+        if p not in para_default:
+            print('unknown parameter: %s' % p)
+    para = {p: para.get(p, para_default[p]) for p in para_default}
+
+    b = None
+    if null != 'shuffle':
+        b = float(ZipfFitter(block['blockRank'], block['blockFreq']).fit_Zipf()['x'][0])
+    if null == 'constraint' and compo_num is None:
+        length = np.array([len(t.split('-')) for t in block['block']])
+        compo_num = int(np.bincount(length, weights = block['blockFreq']).argmax())
+    if null == 'constraint' and len(compo) * constraint < len(block) * compo_num:
+        #checked before the observed pipeline, constraint_draws() would fail in every replicate
+        raise ValueError('%d components * constraint %d < %d draws (%d blocks * compo_num %d)'
+                         % (len(compo), constraint, len(block) * compo_num, len(block), compo_num))
+
+    observed = pipeline_stat(big, block, compo, longest, L, para, max_range)
+
+    seeds = np.random.SeedSequence(seed).spawn(K)
+    initargs = (block, compo, null, b, constraint, compo_num, L, para, max_range)
+    if n_jobs > 1:
+        with ProcessPoolExecutor(n_jobs, initializer = init_replicate, initargs = initargs) as executor:
+            rows = list(executor.map(run_replicate, seeds))
+    else:
+        init_replicate(*initargs)
+        rows = [run_replicate(sd) for sd in seeds]
+    samples = pd.DataFrame(rows, columns = stat_list)
+
+    p_value = {}
+    for k in stat_list:
+        x = samples[k].dropna().to_numpy()
+        if np.isnan(observed[k]):
+            p_value[k] = (np.nan, np.nan)
+        else:
+            p_value[k] = ((1 + np.sum(x <= observed[k])) / (1 + len(x)), (1 + np.sum(x >= observed[k])) / (1 + len(x)))
+
+    result = {}
+    result['observed'] = observed
+    result['samples'] = samples
+    result['p_value'] = p_value
+    return result
@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+'''
+@author  gmking
+
+This module is used to generate fake (null-model) corpora at scale.
+
+read_file_generate_fake() and read_file_generate_fake_constraint() in count.py keep the whole output
+in target_string_list before writing, and draw from the global random module.
+generate_fake() streams the tokens to disk in large buffered writes. The output is split into shards, and
+each shard is written by a worker process with its own stream spawned from np.random.SeedSequence(seed),
+so a corpus is reproducible from a single seed and does not depend on n_jobs.
+
+The output format is the same as read_file_generate_fake(): every token is followed by " ", 21 tokens per line.
+'''
+
+import os
+import shutil
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from .zipfgen import ZipfGenerator
+
+LINE = 21 #tokens per line of a fake script
+
+
+def seed_sequence(seed):
+    #int, None or np.random.SeedSequence -> np.random.SeedSequence
+    if isinstance(seed, np.random.SeedSequence):
+        return seed
+    return np.random.SeedSequence(seed)
+
+def read_roc(roc_file = 'roc2.txt', noun = False):
+    '''read the words of roc2.txt as read_file_generate_fake() does, " " is dropped
+
+    noun: bool, if True, only the words tagged with 'N' are kept
+    return world_list: list of str
+    '''
+    world_list = []
+    with open(roc_file, 'r') as f:
+        for line in f:
+            line_split = line.split("\t")
+            if noun and 'N' not in line_split[4]:
+                continue
+            if line_split[3] != " ":
+                world_list.append(line_split[3])
+    return world_list
+
+def join_blocks(chars, compo_num):
+    #np.array of components -> np.array of blocks, every compo_num consecutive components make one block
+    return np.ascontiguousarray(chars.reshape(-1, compo_num)).view('<U%d' % compo_num).ravel()
+
+def shuffle_blocks(world_list, compo_num, sample_block_num, rng = None):
+    '''fake blocks of read_file_generate_fake(): the components of world_list are shuffled and cut into blocks of compo_num,
+    the blocks are shuffled again and the last sample_block_num blocks are kept
+
+    return blocks: np.array of str, blocks[i] is the block drawn by Zipf rank i+1
+    '''
+    rng = np.random.default_rng(rng)
+    chars = np.array(list(''.join(world_list)))
+    chars = rng.permutation(chars)
+    chars = chars[:len(chars) // compo_num * compo_num]
+    blocks = join_blocks(chars, compo_num)
+    blocks = rng.permutation(blocks)
+    return blocks[-sample_block_num:]
+
+def constraint_draws(n_compo, n_draw, constraint, rng = None, batch = 1 << 20):
+    '''draw n_draw components one by one, each uniformly from the components (0, ..., n_compo-1) which are used less than constraint times
+
+    The draws are made in batches of uniform picks over the components available at the start of the batch.
+    In a batch only the first left[c] picks of every component c are kept: a pick of a used-up component is rejected,
+    so every kept pick is uniform over the components available at that moment (the same ensemble as the one-by-one loop).
+    The used-up components are removed from the available array once per batch.
+
+    return drawn: np.array of int, in the order of drawing
+    '''
+    if n_draw > n_compo * constraint:
+        raise ValueError('%d components * constraint %d < %d draws' % (n_compo, constraint, n_draw))
+    rng = np.random.default_rng(rng)
+    left = np.full(n_compo, constraint) #how many more times each component can be used
+    avail = np.arange(n_compo) #components which can still be used
+    drawn = np.empty(n_draw, dtype = np.int64)
+    done = 0
+    while done < n_draw:
+        m = min(batch, n_draw - done)
+        pick = avail[rng.integers(len(avail), size = m)]
+        #occ[i]: pick[i] is the occ[i]-th pick of that component in this batch
+        order = np.argsort(pick, kind = 'stable')
+        sp = pick[order]
+        start = np.flatnonzero(np.r_[True, sp[1:] != sp[:-1]])
+        occ = np.empty(m, dtype = np.int64)
+        occ[order] = np.arange(m) - np.repeat(start, np.diff(np.r_[start, m])) + 1
+        pick = pick[occ <= left[pick]][:n_draw - done]
+        drawn[done:done + len(pick)] = pick
+        done += len(pick)
+        left -= np.bincount(pick, minlength = n_compo)
+        avail = avail[left[avail] > 0]
+    return drawn
+
+def constraint_blocks(world_list, compo_num, sample_block_num, constraint, rng = None, batch = 1 << 20):
+    '''fake blocks of read_file_generate_fake_constraint(): every component is drawn uniformly from the components
+    which are used less than constraint times (see constraint_draws()), sample_block_num blocks of compo_num components, shuffled
+
+    return blocks: np.array of str
+    '''
+    rng = np.random.default_rng(rng)
+    chars = np.array(list(dict.fromkeys(''.join(world_list))))
+    drawn = constraint_draws(len(chars), sample_block_num * compo_num, constraint, rng, batch)
+    return rng.permutation(join_blocks(chars[drawn], compo_num))
+
+def write_tokens(f, tokens):
+    #write tokens in the format of read_file_generate_fake(), len(tokens) should be a multiple of LINE except the last buffer
+    text = np.char.add(tokens.astype('<U%d' % (tokens.dtype.itemsize // 4 + 2)), ' ') #room for ' ' and '\n'
+    text[LINE - 1::LINE] = np.char.add(text[LINE - 1::LINE], '\n')
+    f.write(''.join(text.tolist()))
+
+def write_shard(blocks, n_token, alpha, generator, seed, path, buffer_token, encoding, offset = 0):
+    '''write one shard of n_token tokens drawn by generator(len(blocks), alpha).sample()
+    offset: position of the first token of the shard in the whole script,
+        a generator whose draws depend on the position (count, EX: DoubleZipfGenerator) continues from it
+    return path
+    '''
+    rng = np.random.default_rng(seed)
+    gen = generator(len(blocks), alpha)
+    if hasattr(gen, 'count'):
+        gen.count = offset
+    with open(path, 'w', encoding = encoding) as f:
+        for start in range(0, n_token, buffer_token):
+            m = min(buffer_token, n_token - start)
+            write_tokens(f, blocks[gen.sample(m, rng)])
+    return path
+
+def generate_fake(blocks, out_file, num_block, alpha = 1.00001, seed = None, n_shards = 1, n_jobs = 1, generator = ZipfGenerator,
+                  buffer_token = LINE * 50000, merge = True, encoding = 'utf-8'):
+    '''stream a fake script of num_block tokens to out_file, the token of rank i+1 is blocks[i]
+
+    ---Input
+    1. blocks: list or np.array of str
+        EX: shuffle_blocks() or constraint_blocks()
+
+    2. out_file: str
+
+    3. num_block: int
+        number of tokens in the fake script
+
+    ---Parameters
+    1. alpha: float, exponent of generator
+
+    2. seed: int, None or np.random.SeedSequence
+        every shard gets a stream spawned from np.random.SeedSequence(seed)
+
+    3. n_shards, n_jobs: int
+        the script is written in n_shards shards by n_jobs worker processes.
+        The result depends on seed and n_shards only.
+
+    4. generator: ZipfGenerator or RejectionInversionZipfGenerator
+        any class with generator(n, alpha).sample(size, rng)
+
+    5. buffer_token: int
+        number of tokens drawn and written at once, rounded down to a multiple of 21 (tokens per line)
+
+    6. merge: bool
+        if True, the shards are concatenated into out_file and removed,
+        else they are kept as out_file.0, out_file.1, ...
+
+    ---Return
+        paths: list of str, the written files
+    '''
+    blocks = np.asarray(blocks, dtype = str)
+    buffer_token = max(LINE, buffer_token // LINE * LINE)
+    #every shard but the last one has whole lines, so the merged file has the same format as a single shard
+    lines = -(-num_block // LINE)
+    per_shard = -(-lines // n_shards) * LINE
+    sizes = [min(per_shard, num_block - i * per_shard) for i in range(n_shards)]
+    sizes = [s for s in sizes if s > 0]
+    seeds = seed_sequence(seed).spawn(len(sizes))
+    paths = ['%s.%d' % (out_file, i) for i in range(len(sizes))]
+
+    offsets = [i * per_shard for i in range(len(sizes))]
+    args = ([blocks]*len(sizes), sizes, [alpha]*len(sizes), [generator]*len(sizes), seeds, paths,
+            [buffer_token]*len(sizes), [encoding]*len(sizes), offsets)
+    if n_jobs > 1:
+        with ProcessPoolExecutor(n_jobs) as executor:
+            paths = list(executor.map(write_shard, *args))
+    else:
+        paths = [write_shard(*a) for a in zip(*args)]
+
+    if merge:
+        with open(out_file, 'wb') as f:
+            for path in paths:
+                with open(path, 'rb') as part:
+                    shutil.copyfileobj(part, f, 1 << 24)
+                os.remove(path)
+        paths = [out_file]
+    return paths
+
+def ngram_reshuffle(inp_file, out_file, word_len, seed = None, buffer_token = LINE * 50000, encoding = 'utf-8'):
+    '''N-gram reshuffle of David_Wang_fake.ipynb: all the components of inp_file (white space removed) are shuffled
+    and cut into blocks of word_len, which are written to out_file in the format of generate_fake()
+
+    The shuffle is one permutation of a component array instead of Python string building.
+    return number of blocks written
+    '''
+    assert word_len > 0
+    with open(inp_file, 'r', encoding = encoding) as f:
+        chars = np.array(list(''.join(f.read().split())))
+    chars = np.random.default_rng(seed).permutation(chars)
+    blocks = join_blocks(chars[:len(chars) // word_len * word_len], word_len)
+    with open(out_file, 'w', encoding = encoding) as f:
+        for start in range(0, len(blocks), buffer_token):
+            write_tokens(f, blocks[start:start + buffer_token])
+    return len(blocks)
+
+def fake_corpus(compo_num = 2, out_file = 'fake1.txt', sample_block_num = 8000, num_block_in_fake_scrip = 15000,
+                alpha = 1.00001, noun = False, constraint = None, seed = None, n_shards = 1, n_jobs = 1,
+                generator = ZipfGenerator, roc_file = 'roc2.txt'):
+    '''the streaming version of read_file_generate_fake() (constraint = None) and read_file_generate_fake_constraint()
+
+    The blocks are built from seed, and the tokens are written by generate_fake() from streams spawned from the same seed.
+    return paths: see generate_fake()
+    '''
+    block_seed, token_seed = seed_sequence(seed).spawn(2)
+    world_list = read_roc(roc_file, noun)
+    if constraint is None:
+        blocks = shuffle_blocks(world_list, compo_num, sample_block_num, block_seed)
+    else:
+        blocks = constraint_blocks(world_list, compo_num, sample_block_num, constraint, block_seed)
+    print("blocks in corpus: ", len(blocks))
+    paths = generate_fake(blocks, out_file, num_block_in_fake_scrip, alpha, token_seed, n_shards, n_jobs, generator)
+    print("A fake script is successfully created !")
+    return paths
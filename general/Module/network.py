@@ -16,84 +16,148 @@ import matplotlib.pyplot as plt
 from Module.count import *
 from Module.Curve_Fitting_MLE import *
 from scipy.optimize import curve_fit
+from scipy import sparse
+from scipy.sparse import csgraph
+from concurrent.futures import ProcessPoolExecutor
+
+def incidence_matrix(coordinate):
+    '''sparse block*component incidence matrix of RRD
+    
+    ---Input
+        coordinate: output from draw_RRD_plot() which is defined in Module.count
+    
+    ---Return
+        A: scipy.sparse.csr_matrix, shape = (max blockRank, max compoRank)
+            A[x-1, y-1] = number of times component y appears in block x (repeated coordinates are summed)
+    '''
+    c = np.asarray(coordinate, dtype = np.int64)
+    A = sparse.coo_matrix((np.ones(len(c), dtype = np.int64), (c[:, 0] - 1, c[:, 1] - 1)), 
+                          shape = (c[:, 0].max(), c[:, 1].max()))
+    return A.tocsr() #duplicates are summed here
+
+def projection(A):
+    '''project the incidence matrix A onto its rows, P = A*A^T with weighted edges
+    
+    P[i, j] (i != j) = number of pairs (i, j) sharing a column, i.e. the weight of edge (i+1, j+1)
+    P[i, i] = number of pairs of the repeated i in the same column (self-loop), 
+              ex: component 'A' of block 'A-A' gives a self-loop A-A in G_compo
+    rows that share no column with other rows ("lonely" nodes) have no edge, so they are not nodes of the graph
+    
+    ---Return
+        P: scipy.sparse.csr_matrix, symmetric
+    '''
+    P = (A @ A.T).tocsr()
+    loop = np.asarray((A.multiply(A) - A).sum(axis = 1)).ravel() // 2 #sum of C(A_iy, 2) over y
+    P.setdiag(loop)
+    P.eliminate_zeros()
+    return P
+
+def graph_from_projection(P):
+    '''build nx.Graph() from the upper triangle of a projection matrix, nodes are labeled by rank (start from 1)
+    '''
+    U = sparse.triu(P).tocoo()
+    G = nx.Graph()
+    G.add_weighted_edges_from(zip((U.row + 1).tolist(), (U.col + 1).tolist(), U.data.tolist()))
+    return G
+
+def sparse_clustering(P, chunk = 2048):
+    '''local clustering coefficient of every node from a projection matrix, the same as nx.clustering() (unweighted)
+    c_i = 2*T_i / (d_i*(d_i - 1)), where T_i = number of triangles through i, d_i = degree without self-loop
+    
+    2*T_i = diag(B^3)_i = sum_j B_ij * (B^2)_ij, where B is the 0/1 adjacency matrix without self-loop.
+    Rows are processed chunk by chunk, so only chunk*V entries of B^2 exist at the same time.
+    
+    ---Input
+        P: scipy.sparse matrix, return of projection()
+    
+    ---Parameters
+        chunk: int, default = 2048
+            number of rows of B^2 computed at once
+    
+    ---Return
+        cluster: dict, {node: clustering coefficient}, nodes are labeled by rank (start from 1) 
+            only the nodes of graph_from_projection(P) (nodes with at least one edge) are included
+    '''
+    P = sparse.csr_matrix(P)
+    node = np.flatnonzero(np.diff(P.indptr)) #rows with at least one edge (self-loop included)
+    B = P.copy()
+    B.setdiag(0)
+    B.eliminate_zeros()
+    B.data = np.ones_like(B.data, dtype = np.int64)
+    d = np.diff(B.indptr)
+    
+    tri = np.zeros(B.shape[0], dtype = np.int64) #2*T_i
+    for start in range(0, B.shape[0], chunk):
+        Bc = B[start:start + chunk]
+        tri[start:start + chunk] = np.asarray((Bc @ B).multiply(Bc).sum(axis = 1)).ravel()
+    
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        c = np.where(d > 1, tri / (d * (d - 1.0)), 0.0)
+    return dict(zip((node + 1).tolist(), c[node].tolist()))
+
+def degree_sequence(P):
+    '''degree sequence of graph_from_projection(P) without building the graph
+    degree = number of distinct neighbors + 2 if the node has a self-loop (the same as nx.Graph().degree()),
+    nodes without any edge ("lonely" nodes) are not included
+    
+    ---Return
+        degree: list, sorted from big to small
+    '''
+    P = sparse.csr_matrix(P)
+    nnz = np.diff(P.indptr)
+    loop = (P.diagonal() != 0).astype(np.int64)
+    d = nnz + loop #nnz counts a self-loop once, nx counts it twice
+    return sorted(d[nnz > 0].tolist(), reverse = True)
+
+def build_degree(coordinate):
+    '''degree sequences of G_block and G_compo, directly from the sparse incidence matrix.
+    It gives the same block_degree_sequence and compo_degree_sequence as build_edge(), 
+    but builds neither networkx graphs nor clustering coefficients.
+    Use it when you only need plot_degree_block() and plot_degree_compo().
+    
+    ---Input
+        coordinate: output from draw_RRD_plot() which is defined in Module.count
+    
+    ---Return
+        block_degree_sequence, compo_degree_sequence: list
+    '''
+    A = incidence_matrix(coordinate)
+    return degree_sequence(projection(A)), degree_sequence(projection(A.T.tocsr()))
 
 def build_edge(coordinate):
     '''construct the graph of block and component
        G_block: if two blocks appear in the same compo, there is a edge
        G_compo: if two components appear in the same block, they is a edge
        
+       The projections are sparse products of the block*component incidence matrix A,
+       i.e. A*A^T for G_block and A^T*A for G_compo. The edge attribute 'weight' is the number of shared components (blocks).
+       
        ---Input
            coordinate: output from draw_RRD_plot() which is defined in Module.count
        
        ---Return
        1. graph_block: list, contains G_block, cluster_block, and block_degree_sequence
            (1) G_block: nx.Graph(), constructed by nodes (blocks) and edges 
-           (2) cluster_block: nx.clustering(), clustering coefficient of nodes in G_block
+           (2) cluster_block: dict, clustering coefficient of nodes in G_block, the same as nx.clustering(), see sparse_clustering()
            (3) block_degree_sequence: G_block.degree(), sequence sorted by degree of nodes in G_block
        
        2. graph_compo: list, contains G_compo, cluster_compo, and compo_degree_sequence
            (1) G_compo: nx.Graph(), constructed by nodes (components) and edges
-           (2) cluster_compo: nx.clustering(), clustering coefficient of nodes in G_compo
+           (2) cluster_compo: dict, clustering coefficient of nodes in G_compo, the same as nx.clustering(), see sparse_clustering()
            (3) compo_degree_sequence:  G_compo.degree(), sequence sorted by degree of nodes in G_compo       
     '''    
-    
-    x, y = [], []
-    for i in range(len(coordinate)):
-        x.append(coordinate[i][0])
-        y.append(coordinate[i][1])
-
-    temp = sorted(coordinate, key = lambda x: x[1])
-    edge_block = np.zeros((max(x), max(x)))
-    lonely_block = [] #share no components to other block
-    edge_block_list = []
-
-    for j in range(max(y)):
-        col = []
-        for i in temp:
-            if i[1] == j+1:   #block share the same components
-                col.append(i[0])
-            elif i[1] > j+1:
-                break
-        for k in range(len(col)):
-            if len(col) == 1:
-                lonely_block.append((col[k], col[k]))
-            else:
-                for m in range(k+1, len(col)):
-                    edge_block[col[k]-1][col[m]-1] += 1
-                    edge_block[col[m]-1][col[k]-1] += 1
-                    edge_block_list.append((col[k], col[m]))
-                    
-    temp = sorted(coordinate, key = lambda x: x[0])
-    edge_compo = np.zeros((max(y), max(y)))
-    lonely_compo = []  #share no block to other components
-    edge_compo_list = []
-    
-    for j in range(max(x)):
-        com = [] 
-        for i in temp:
-            if i[0] == j+1:   #components share the same block
-                com.append(i[1])
-            elif i[0] > j+1:
-                break
-        for k in range(len(com)):
-            if len(com) == 1:
-                lonely_compo.append((com[k], com[k]))
-            else:
-                for m in range(k+1, len(com)):
-                    edge_compo[com[k]-1][com[m]-1] += 1
-                    edge_compo[com[m]-1][com[k]-1] += 1
-                    edge_compo_list.append((com[k], com[m]))
+    A = incidence_matrix(coordinate)
                     
-    G_block = nx.Graph()
-    G_block.add_edges_from(edge_block_list)
-    cluster_block = nx.clustering(G_block)
+    P_block = projection(A)
+    G_block = graph_from_projection(P_block)
+    cluster_block = sparse_clustering(P_block)
     block_degree_sequence = sorted([d for n, d in G_block.degree()], reverse=True)  # degree sequence
 
     graph_block = (G_block, cluster_block, block_degree_sequence)
     
-    G_compo = nx.Graph()
-    G_compo.add_edges_from(edge_compo_list)
-    cluster_compo = nx.clustering(G_compo)
+    P_compo = projection(A.T.tocsr())
+    G_compo = graph_from_projection(P_compo)
+    cluster_compo = sparse_clustering(P_compo)
     compo_degree_sequence = sorted([d for n, d in G_compo.degree()], reverse=True)  # degree sequence
     
     graph_compo = (G_compo, cluster_compo, compo_degree_sequence)
@@ -233,7 +297,7 @@ def plot_degree_block(name, block_degree_sequence, FORMAT = 'pdf', Path = ''):
     except:
         plt.show()
 
-def plot_degree_compo(name, compo_degree_sequence, FORMAT = 'pdf', Path = ''):
+def plot_degree_compo(name, compo_degree_sequence, FORMAT = 'pdf', Path = '', num_curve = 500):
     '''draw degree distribution of component network
 
     ---Parameters
@@ -253,6 +317,9 @@ def plot_degree_compo(name, compo_degree_sequence, FORMAT = 'pdf', Path = ''):
         if Path == np.nan, no figure will be saved (just show it)
         else, the figure will be saved according to Path
     
+    5. num_curve: int
+        number of log-spaced points used to draw the fitted curve, see Curve_Fitting_MLE.py > log_grid()
+    
     ---Output
         save or show a figure of degree distribution
     
@@ -277,9 +344,8 @@ def plot_degree_compo(name, compo_degree_sequence, FORMAT = 'pdf', Path = ''):
         if i != 0:
             T[0].append(i)
             T[1].append(D[i])
-    Y = Two_to_One(T)
     
-    xdata = np.linspace(min(T[0]), max(T[0]), num = (max(T[0]) - min(T[0]))*10)
+    xdata = log_grid(min(T[0]), max(T[0]), num_curve)
     
     #Estimate exponent. This action can make reduce the error of initial value guess.
     freq_M, freq_m = max(T[1]), min(T[1])
@@ -287,7 +353,7 @@ def plot_degree_compo(name, compo_degree_sequence, FORMAT = 'pdf', Path = ''):
     b_0 = np.log(freq_M / freq_m) / np.log(rank_M / rank_m)
 
     #fit Zipf-Mandelbrot: P(x, b_ZM, c_ZM)=a_ZM/(x + c_ZM)^b_ZM
-    res_ZM = minimize(L_Zipf_Mandelbrot, (b_0, 0), Y)
+    res_ZM = ZipfFitter(T[0], T[1]).fit_Zipf_Mandelbrot((b_0, 0))
     
     b_ZM = float(res_ZM['x'][0])
     c_ZM = float(res_ZM['x'][1])
@@ -370,34 +436,143 @@ def plot_degree_compo(name, compo_degree_sequence, FORMAT = 'pdf', Path = ''):
         plt.show()
     return degree_component
         
-def build_shortest_path(graph):
-    pathL = nx.shortest_path_length(graph)  #shorest path length
-    #in networkx 2.0, the structure of pathL will be 
-    #[(source_A, {target_B: distance, target_C: distance}), (source_B, {...}), ...]
-    sum_shorest_path= []
-    for source_i, target_set in pathL: #target_set = {target: distance, target: distance, ...}
-        sp_i = 0 #sum_shorest_path for node i
-        for j in target_set:
-            sp_i += target_set[j]
-        sum_shorest_path.append(sp_i)    
-    return sum_shorest_path
+#adjacency matrix shared by the workers of path_sum(), filled by init_path() once per worker process
+shared_graph = {}
+
+def init_path(M):
+    shared_graph['M'] = M
+
+def path_sum(sources):
+    '''sum of shortest path lengths from every source in sources to all reachable nodes (BFS on CSR)
+    only len(sources)*V distances exist at the same time
+    '''
+    D = csgraph.shortest_path(shared_graph['M'], method = 'D', directed = False, unweighted = True, indices = sources)
+    D[np.isinf(D)] = 0 #unreachable
+    return D.sum(axis = 1).astype(np.int64)
+
+def adjacency(graph):
+    '''unweighted sparse adjacency matrix of graph (one direction per edge), row i = the i-th node of list(graph)
+    '''
+    index = {v: i for i, v in enumerate(graph)}
+    e = np.array([(index[u], index[v]) for u, v in graph.edges()], dtype = np.int64).reshape(-1, 2)
+    n = len(index)
+    return sparse.coo_matrix((np.ones(len(e)), (e[:, 0], e[:, 1])), shape = (n, n)).tocsr()
+
+def path_sums(M, sources, chunk = 256, n_jobs = 1):
+    '''run path_sum() over sources in chunks, in parallel if n_jobs > 1
+    '''
+    chunks = [sources[i:i + chunk] for i in range(0, len(sources), chunk)]
+    if n_jobs > 1:
+        with ProcessPoolExecutor(n_jobs, initializer = init_path, initargs = (M,)) as executor:
+            sums = list(executor.map(path_sum, chunks))
+    else:
+        init_path(M)
+        sums = [path_sum(c) for c in chunks]
+    if sums == []:
+        return np.array([], dtype = np.int64)
+    return np.concatenate(sums)
+
+def build_shortest_path(graph, chunk = 256, n_jobs = 1):
+    '''sum of shortest path lengths from each node to all the other reachable nodes
+    
+    ---Input
+        graph: nx.Graph(), G_block or G_compo from build_edge()
+    
+    ---Parameters
+    1. chunk: int, default = 256
+        number of sources computed at once. Memory = chunk * (number of nodes) distances per worker
+    
+    2. n_jobs: int, default = 1
+        number of worker processes
+    
+    ---Return
+        sum_shorest_path: list, sum_shorest_path[i] is the sum for the i-th node of graph
+    '''
+    M = adjacency(graph)
+    return path_sums(M, np.arange(M.shape[0]), chunk, n_jobs).tolist()
+
+def sample_shortest_path(graph, n_source = 1000, seed = None, chunk = 256, n_jobs = 1):
+    '''estimate the average shortest path length from randomly sampled sources, for graphs too large for build_shortest_path()
+    
+    Only sources with at least one neighbor (other than itself) are sampled without replacement, 
+    which are exactly the nodes counted by plot_shortest_path(). 
+    avg = mean(sampled sums)/(n_nonzero - 1),
+    stderr = std(sampled sums)/sqrt(n_source) * sqrt((n_nonzero - n_source)/(n_nonzero - 1))/(n_nonzero - 1)
+    (standard error with finite population correction; avg +- 2*stderr is about 95% confidence)
+    
+    ---Input
+        graph: nx.Graph(), G_block or G_compo from build_edge()
+    
+    ---Parameters
+    1. n_source: int, default = 1000
+        number of sampled sources. If n_source >= n_nonzero, the result is exact (stderr = 0)
+    
+    2. seed: int, default = None
+        seed of sampling
+    
+    3. chunk, n_jobs: see build_shortest_path()
+    
+    ---Return
+        sampled: dict
+            sampled['sum_shortest_path']: list, sums of the sampled sources
+            sampled['n']: number of nodes in graph
+            sampled['n_nonzero']: number of nodes having a neighbor
+            sampled['avg']: estimated average shortest path length (without zero)
+            sampled['stderr']: standard error of sampled['avg']
+            if n_nonzero <= 1, avg = stderr = 0
+    '''
+    M = adjacency(graph)
+    B = M + M.T
+    B.setdiag(0)
+    B.eliminate_zeros()
+    candidate = np.flatnonzero(np.diff(B.indptr))
+    n_nonzero = len(candidate)
+    if n_nonzero <= 1:
+        #no path between two different nodes, as plot_shortest_path() avg = 0
+        return {'sum_shortest_path': [0]*n_nonzero, 'n': M.shape[0], 'n_nonzero': n_nonzero, 'avg': 0.0, 'stderr': 0.0}
+    rng = np.random.default_rng(seed)
+    sources = np.sort(rng.choice(candidate, size = min(n_source, n_nonzero), replace = False))
+    sums = path_sums(M, sources, chunk, n_jobs)
+    
+    k = len(sums)
+    avg = sums.mean()/(n_nonzero - 1)
+    if k < n_nonzero and k > 1:
+        stderr = sums.std(ddof = 1)/k**0.5 * ((n_nonzero - k)/(n_nonzero - 1))**0.5/(n_nonzero - 1)
+    else:
+        stderr = 0.0
+    
+    sampled = {}
+    sampled['sum_shortest_path'] = sums.tolist()
+    sampled['n'] = M.shape[0]
+    sampled['n_nonzero'] = n_nonzero
+    sampled['avg'] = float(avg)
+    sampled['stderr'] = float(stderr)
+    return sampled
 
 
 def plot_shortest_path(name, sum_shorest_path, G_name, FORMAT = 'pdf', Path = ''):
     '''
-    sum_shorest_path: list
-        output of build_shortest_path
+    sum_shorest_path: list or dict
+        output of build_shortest_path (exact) or sample_shortest_path (estimated)
     G_name: str
         name of graph, can use latex form like $G_b$ (for block) or $G_c$ (for component)
     '''
-    nonzero_sp = []
-    for i in sum_shorest_path:
-        if i !=0:
-            nonzero_sp.append(i)
-    n_nonzero = len(nonzero_sp)
-    avg_spL = sum(nonzero_sp)/(n_nonzero*(n_nonzero-1))
-    n = len(sum_shorest_path)
-    sp = [i/n for i in sum_shorest_path]
+    if isinstance(sum_shorest_path, dict):
+        #sampled sources, see sample_shortest_path()
+        n = sum_shorest_path['n']
+        sp = [i/n for i in sum_shorest_path['sum_shortest_path']]
+        avg_spL = sum_shorest_path['avg']
+        avg_text = 'Average without zero=%.2f$\\pm$%.2f' % (avg_spL, 2*sum_shorest_path['stderr'])
+    else:
+        nonzero_sp = []
+        for i in sum_shorest_path:
+            if i !=0:
+                nonzero_sp.append(i)
+        n_nonzero = len(nonzero_sp)
+        avg_spL = sum(nonzero_sp)/(n_nonzero*(n_nonzero-1)) if n_nonzero > 1 else 0
+        n = len(sum_shorest_path)
+        sp = [i/n for i in sum_shorest_path]
+        avg_text = 'Average without zero=%.2f' % avg_spL
 
     fig, ax = plt.subplots()
     plt.hist(sp, bins = 20)
@@ -411,7 +586,7 @@ def plot_shortest_path(name, sum_shorest_path, G_name, FORMAT = 'pdf', Path = ''
     plt.title('Distribution of path length', fontsize = 20)
     ym, yM = plt.ylim()
     xm, xM = plt.xlim()
-    plt.text(xM/6+xm*5/6, yM/2, 'Average without zero=%.2f' % avg_spL, fontsize=20)
+    plt.text(xM/6+xm*5/6, yM/2, avg_text, fontsize=20)
     try:
         if Path == '':
             fig.savefig('path_' + G_name + '_' + name + '.' + FORMAT, dpi = 400, format = FORMAT)
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+'''
+@author  gmking
+
+This module is used to tune the de-noising parameters of denoise.py in one batch job.
+
+toler, num_section, delta, percent, D_0, Lambda and num_window used to be tuned by hand,
+re-running plot_g() -> rg() -> fit_with_cut() for every try.
+sweep_denoise() evaluates many parameter sets (grid search or random search) in parallel with the
+compute-only functions of denoise.py, and returns a table ranked by SC value and fitting score.
+
+The choose_point() output does not depend on these parameters, so it is computed once and shared by all trials.
+'''
+
+import itertools
+import random
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from .denoise import choose_points, denoise_g, rg_stat, search_cut, fitting_score
+
+para_default = {'toler': 50, 'num_window': 101, 'num_section': 2, 'delta': 0.15, 'percent': 0.05, 'D_0': 50, 'Lambda': 1}
+
+#shared input of every trial, filled by init_trial() once per worker process
+shared = {}
+
+
+def make_trials(grid, n_random = None, seed = None):
+    '''build the parameter sets of every trial
+
+    ---Input
+        grid: dict, {parameter: list of values}
+            parameter must be one of para_default, the parameters which are not in grid use para_default
+            EX: grid = {'delta': [0.1, 0.15, 0.2], 'percent': [0.03, 0.05]}
+
+    ---Parameters
+    1. n_random: int, default = None
+        if None, use every combination of grid (grid search)
+        else, randomly pick n_random combinations of grid (random search)
+
+    2. seed: int, default = None
+        seed of random search
+
+    ---Return
+        trials: list of dict, each dict contains all parameters in para_default
+    '''
+    for p in grid:
+        if p not in para_default:
+            print('unknown parameter: %s' % p)
+    keys = [p for p in grid if p in para_default]
+    combination = list(itertools.product(*[grid[p] for p in keys]))
+    if n_random is not None and n_random < len(combination):
+        combination = random.Random(seed).sample(combination, n_random)
+
+    trials = []
+    for c in combination:
+        para = dict(para_default)
+        para.update(zip(keys, c))
+        trials.append(para)
+    return trials
+
+def init_trial(L, V, H, points_set, Zipf):
+    '''store the shared input in each worker process, so that points_set is sent once per worker instead of once per trial
+    '''
+    shared['L'] = L
+    shared['V'] = V
+    shared['H'] = H
+    shared['points_set'] = points_set
+    shared['Zipf'] = Zipf
+
+def run_trial(para):
+    '''de-noise -> r_g -> fit with cut for one parameter set, without drawing any figure
+
+    ---Return
+        row: dict, para plus R, ERROR, S, C, SC, cut, basis, tot_Dev, A, C_fit and score
+            if a step fails, its values are nan
+    '''
+    L, V, H, points_set, Zipf = shared['L'], shared['V'], shared['H'], shared['points_set'], shared['Zipf']
+    row = dict(para)
+    for k in ['R', 'ERROR', 'S', 'C', 'SC', 'cut', 'tot_Dev', 'A', 'C_fit', 'score']:
+        row[k] = np.nan
+    row['basis'] = None
+
+    try:
+        g, glu = denoise_g(L, V, H, points_set, **para)
+        stat = rg_stat(g)
+    except (ValueError, ZeroDivisionError) as e:
+        print('trial %s failed: %s' % (para, e))
+        return row
+    row['R'], row['ERROR'], row['S'], row['C'], row['SC'] = stat['R'], stat['ERROR'], stat['S'], stat['C_value'], stat['SC']
+
+    #Rg_0 is rounded as rg() does
+    #curve_fit() raises TypeError / ValueError on empty or too short cut lines, which extreme parameters can give
+    try:
+        found = search_cut(glu, format(stat['R'], '.3f'), V, Zipf)
+        if found is not None:
+            cut, D, fit_para, tot_Dev, best = found
+            score = fitting_score(D, V)
+    except (ValueError, ZeroDivisionError, TypeError, IndexError, RuntimeError) as e:
+        print('trial %s failed in fitting: %s' % (para, e))
+        return row
+    if found is not None:
+        row['cut'] = cut
+        row['basis'] = best
+        row['tot_Dev'] = tot_Dev[best]
+        row['A'], row['C_fit'] = fit_para[best][0]
+        row['score'] = score
+    return row
+
+def sweep_denoise(L, V, H, big, longest, Zipf, grid, n_random = None, seed = None, n_jobs = 1):
+    '''search the de-noising parameters by grid search or random search
+
+    ---Input
+    1. L: int
+        number of scaling line, see denoise.py > plot_g()
+
+    2. V, H: list or np.array
+        You should get these two from V, H = geometric_sequence(block, compo)
+        see count.py for details
+
+    3. big, longest: pandas.DataFrame, int
+        the return of  info()
+        see count.py for details
+
+    4. Zipf: tuple (a, b), (str, str)
+        (a, b) = FRD_block['ab'], see denoise.py > scaling_fit()
+
+    5. grid: dict, {parameter: list of values}
+        see make_trials()
+
+    ---Parameters
+    1. n_random, seed:
+        see make_trials()
+
+    2. n_jobs: int, default = 1
+        number of worker processes. n_jobs = 1 runs trials one by one.
+
+    ---Return
+        table: pandas.DataFrame, one row per trial, see run_trial() for columns
+            ranked by SC (big to small), score (big to small) and tot_Dev (small to big)
+    '''
+    points_set = choose_points(L, V, H, big, longest)
+    trials = make_trials(grid, n_random, seed)
+    initargs = (L, V, H, points_set, Zipf)
+
+    if n_jobs > 1:
+        with ProcessPoolExecutor(n_jobs, initializer = init_trial, initargs = initargs) as executor:
+            rows = list(executor.map(run_trial, trials))
+    else:
+        init_trial(*initargs)
+        rows = [run_trial(para) for para in trials]
+
+    table = pd.DataFrame(rows)
+    table = table.sort_values(by = ['SC', 'score', 'tot_Dev'], ascending = [False, False, True], na_position = 'last')
+    return table.reset_index(drop = True)
@@ -4,16 +4,68 @@ Created on Wed Oct 19 18:51:46 2016
 A programme generating texts whose word frequency is governed by
 Zipf's law. 
 @author: shan
+
+Every generator draws an integer between 0 and n-1 (the rank - 1 of a block) with
+next() (one draw from the global random module) or sample(size, rng) (vectorized batch).
+The generators with a stored CDF share CDFGenerator:
+ZipfGenerator, GaussianGenerator, LogGaussianGenerator, ExponentialGenerator.
+DoubleZipfGenerator alternates between two ZipfGenerator over the two halves of the ranks.
+RejectionInversionZipfGenerator draws Zipf without a CDF.
+The constrained blocks and the N-gram reshuffle are in fake.py > constraint_blocks(), ngram_reshuffle().
 """
 
 
 import random 
 import bisect 
 import math 
-from functools import reduce
+import numpy as np
 
 
-class ZipfGenerator: 
+class CDFGenerator: 
+    """
+    CDFGenerator is the base of the generators which store a cumulative distribution function.
+    A subclass computes the non-normalized weights of 1, ..., n and calls CDFGenerator.__init__(self, weights).
+    """
+
+    
+    def __init__(self, weights): 
+        """Initialize the CDF from the non-normalized weights of 1, ..., n.
+         Paramerters
+         weights: np.array
+        """
+        zeta = np.concatenate([[0], np.cumsum(weights)]) #O(n), the reduce() of list concatenation was O(n^2)
+
+        # Store the translation map: 
+        # Abstract function: representing the cumulative distribution function 
+        self.distMap = zeta / zeta[-1]
+
+    def next(self): 
+        """Yield an integer between 0 and n-1, with probability governed by 
+        the distribution function of the generator.
+        """
+        # Take a uniform 0-1 pseudo-random value: 
+        u = random.random()  
+
+        # Translate the variable: 
+        return bisect.bisect(self.distMap, u) - 1
+    
+    def sample(self, size, rng = None):
+        """Draw size integers between 0 and n-1 at once, same distribution as next().
+         Paramerters
+         size: int or tuple
+         
+         rng: np.random.Generator, int or None
+            passed to np.random.default_rng()
+        """
+        u = np.random.default_rng(rng).random(size)
+        return np.searchsorted(self.distMap, u, side = 'right') - 1
+    
+    def __get_n(self):
+        ans = self.n
+        return ans
+
+
+class ZipfGenerator(CDFGenerator): 
     """
     ZipfGenerator is an immutable type representing a Zipf cumulative dicstribution
     function with patameters alpha and n. 
@@ -41,36 +93,110 @@ class ZipfGenerator:
         assert int(n) == n 
         self.n = n
         self.alpha = alpha
-        tmp = [1. / (math.pow(float(i), alpha)) for i in range(1, n+1)] 
-        zeta = reduce(lambda sums, x: sums + [sums[-1] + x], tmp, [0]) 
+        CDFGenerator.__init__(self, np.arange(1, n+1, dtype = float) ** -alpha)
+    
+    def __get_alpha(self):
+        ans = self.alpha
+        return ans
 
-        # Store the translation map: 
-        # Abstract function: representing the cumulative distribution function 
-        # of a Zipf pmf 
-        self.distMap = [x / zeta[-1] for x in zeta] 
+def helper1(x):
+    """log(1 + x) / x, -> 1 as x -> 0"""
+    x = np.asarray(x, dtype = float)
+    small = np.abs(x) < 1e-8
+    safe = np.where(small, 1.0, x)
+    return np.where(small, 1 - x/2 + x**2/3, np.log1p(safe) / safe)
 
+def helper2(x):
+    """(exp(x) - 1) / x, -> 1 as x -> 0"""
+    x = np.asarray(x, dtype = float)
+    small = np.abs(x) < 1e-8
+    safe = np.where(small, 1.0, x)
+    return np.where(small, 1 + x/2 + x**2/6, np.expm1(safe) / safe)
+
+
+class RejectionInversionZipfGenerator: 
+    """
+    RejectionInversionZipfGenerator draws the same Zipf distribution as ZipfGenerator(n, alpha)
+    without storing its CDF, so memory is O(1) for any n.
+    
+    Rejection-inversion sampling of 
+    W. Hormann and G. Derflinger, "Rejection-inversion to generate variates from monotone discrete distributions",
+    ACM TOMACS 6 (1996) 169-184 (the same scheme as Apache Commons RejectionInversionZipfSampler).
+    The integral of the hat function and its inverse are written with log1p / expm1,
+    so alpha close to 1 (EX: alpha = 1.00001 in read_file_generate_fake()) is stable.
+    The expected number of trials per sample is close to 1.
+    """
+
+    
+    def __init__(self, n, alpha): 
+        """Initialize a Zipf sampler.
+         Paramerters
+         n: int 
+            n >= 1
+         
+         alpha: float 
+            alpha > 0
+        """
+        assert n >= 1 and alpha > 0
+        assert int(n) == n 
+        self.n = n
+        self.alpha = alpha
+        self.hIntegralX1 = self.hIntegral(1.5) - 1
+        self.hIntegralN = self.hIntegral(n + 0.5)
+        self.s = 2 - self.hIntegralInverse(self.hIntegral(2.5) - self.h(2))
+    
+    def h(self, x):
+        #hat function x^-alpha
+        return np.exp(-self.alpha * np.log(x))
+    
+    def hIntegral(self, x):
+        #integral of h from 1 to x, (x^(1 - alpha) - 1) / (1 - alpha)
+        log_x = np.log(x)
+        return helper2((1 - self.alpha) * log_x) * log_x
+    
+    def hIntegralInverse(self, x):
+        t = np.maximum(x * (1 - self.alpha), -1)
+        return np.exp(helper1(t) * x)
+    
+    def sample(self, size, rng = None):
+        """Draw size integers between 0 and n-1 at once, same distribution as ZipfGenerator(n, alpha).sample().
+         Rejected candidates are redrawn in smaller and smaller batches.
+         Paramerters
+         size: int or tuple
+         
+         rng: np.random.Generator, int or None
+            passed to np.random.default_rng()
+        """
+        rng = np.random.default_rng(rng)
+        total = int(np.prod(size))
+        out = np.empty(total, dtype = np.int64)
+        todo = np.arange(total)
+        while len(todo) > 0:
+            u = self.hIntegralN + rng.random(len(todo)) * (self.hIntegralX1 - self.hIntegralN)
+            x = self.hIntegralInverse(u)
+            k = np.clip(np.floor(x + 0.5), 1, self.n)
+            accept = (k - x <= self.s) | (u >= self.hIntegral(k + 0.5) - self.h(k))
+            out[todo[accept]] = k[accept] - 1
+            todo = todo[~accept]
+        return out.reshape(size)
+    
     def next(self): 
-        """Yield an integer between 0 and n, with probability governed by 
+        """Yield an integer between 0 and n-1, with probability governed by 
         Zipf distribution function specified by n and alpha.
+        Uniform values are taken from the global random module as ZipfGenerator.next().
         """
-        # Take a uniform 0-1 pseudo-random value: 
-        u = random.random()  
+        while True:
+            u = self.hIntegralN + random.random() * (self.hIntegralX1 - self.hIntegralN)
+            x = float(self.hIntegralInverse(u))
+            k = min(max(int(x + 0.5), 1), self.n)
+            if k - x <= self.s or u >= self.hIntegral(k + 0.5) - self.h(k):
+                return k - 1
 
-        # Translate the Zipf variable: 
-        return bisect.bisect(self.distMap, u) - 1
-    
-    def __get_alpha(self):
-        ans = self.alpha
-        return ans
-    
-    def __get_n(self):
-        ans = self.n
-        return ans
 
-class GaussianGenerator: 
+class GaussianGenerator(CDFGenerator): 
     """
     GaussianGenerator is an immutable type representing a Gaussian CDF
-    with patameters sigma and n; centre located at 1.0   
+    with patameters sigma and n; centre located at mu   
 
     """
 
@@ -92,29 +218,112 @@ class GaussianGenerator:
         self.n = n
         self.sigma = sigma
         self.mu = mu
-        tmp = [math.exp(-(i - mu)**2 / (2 * sigma**2)) for i in range(1, n+1)] 
-        zeta = reduce(lambda sums, x: sums + [sums[-1] + x], tmp, [0]) 
+        CDFGenerator.__init__(self, np.exp(-(np.arange(1, n+1) - mu)**2 / (2 * sigma**2)))
 
-        # Store the translation map: 
-        # Abstract function: representing the cumulative distribution function 
-        # of a Gaussian pmf 
-        self.distMap = [x / zeta[-1] for x in zeta] 
 
-    def next(self): 
-        """Yield an integer between 0 and n, with probability governed by 
-        Zipf distribution function specified by n and alpha.
+class LogGaussianGenerator(CDFGenerator): 
+    """
+    LogGaussianGenerator is an immutable type representing a log-normal CDF
+    with patameters sigma, mu and n (LogNormal.ipynb)
+
+    """
+
+    
+    def __init__(self, n, sigma , mu = 0.0): 
+        """Ininitialize a log-normal CDF.
+         Paramerters
+         n: int 
+            n >= 0
+         
+         sigma: float 
+            sigma >= 1
+            
+         mu: float
         """
-        # Take a uniform 0-1 pseudo-random value: 
-        u = random.random()  
+        assert n >= 0 and sigma >= 1.0
+        assert int(n) == n 
+        self.n = n
+        self.sigma = sigma
+        self.mu = mu
+        i = np.arange(1, n+1, dtype = float)
+        CDFGenerator.__init__(self, np.exp(-(np.log(i) - mu)**2 / (2 * sigma**2)) / (i * sigma))
+
+
+class ExponentialGenerator(CDFGenerator): 
+    """
+    ExponentialGenerator is an immutable type representing an exponential CDF
+    with patameters sigma and n (Expotential.ipynb), P(i) ~ exp(-sigma i)
+
+    """
 
-        # Translate the Zipf variable: 
-        return bisect.bisect(self.distMap, u) - 1
     
-    def __get_alpha(self):
-        ans = self.alpha
-        return ans
+    def __init__(self, n, sigma): 
+        """Ininitialize an exponential CDF.
+         Paramerters
+         n: int 
+            n >= 0
+         
+         sigma: float 
+            sigma >= 0
+        """
+        assert n >= 0 and sigma >= 0.0
+        assert int(n) == n 
+        self.n = n
+        self.sigma = sigma
+        #exp(-sigma (i - 1)) has the same CDF as exp(-sigma i) and does not underflow at i = 1
+        CDFGenerator.__init__(self, np.exp(-sigma * np.arange(0, n, dtype = float)))
+
+
+class DoubleZipfGenerator: 
+    """
+    DoubleZipfGenerator is the double power law of DoubleZipf.ipynb:
+    the tokens at even positions are drawn by ZipfGenerator(n//2, alpha) from the first half of the blocks,
+    the tokens at odd positions by ZipfGenerator(n//2, alpha2) from the second half.
     
-    def __get_n(self):
-        ans = self.n
-        return ans
+    The blocks are two shuffles of the same block list concatenated, EX: for fake.py > generate_fake()
+    blocks = np.concatenate([shuffle_blocks(...), shuffle_blocks(...)]), generator = functools.partial(DoubleZipfGenerator, alpha2 = 1.5501)
 
+    """
+
+    
+    def __init__(self, n, alpha, alpha2 = 1.001): 
+        """Initialize two Zipf CDFs.
+         Paramerters
+         n: int 
+            n >= 0, number of blocks of both halves
+         
+         alpha, alpha2: float 
+            alpha >= 1, alpha2 >= 1
+        """
+        self.n = n
+        self.alpha = alpha
+        self.alpha2 = alpha2
+        self.gen_1 = ZipfGenerator(n // 2, alpha)
+        self.gen_2 = ZipfGenerator(n // 2, alpha2)
+        self.count = 0 #number of tokens drawn by next() and sample()
+    
+    def next(self): 
+        """Yield an integer between 0 and n-1, alternating between the two halves
+        """
+        self.count += 1
+        if self.count % 2 == 1: 
+            return self.gen_1.next()
+        return self.n // 2 + self.gen_2.next()
+    
+    def sample(self, size, rng = None):
+        """Draw size integers between 0 and n-1 at once, continuing the alternation of next():
+         the positions self.count, self.count + 2, ... of the whole stream are drawn from the first half, the others from the second half,
+         so a stream drawn by several calls (EX: the buffers of fake.py > write_shard()) alternates as one call.
+         Paramerters
+         size: int
+         
+         rng: np.random.Generator, int or None
+            passed to np.random.default_rng()
+        """
+        rng = np.random.default_rng(rng)
+        out = np.empty(size, dtype = np.int64)
+        o = self.count % 2
+        out[o::2] = self.gen_1.sample(len(out[o::2]), rng)
+        out[1 - o::2] = self.n // 2 + self.gen_2.sample(len(out[1 - o::2]), rng)
+        self.count += size
+        return out